@@ -11,6 +11,9 @@ from .op_fieldagents import *
 from .op_experimental import *
 from .property import *
 from .propertyset import *
+from .accumulator import *
+from .relation import *
+from .storage import *
 
 from .__about__ import (
     __version__, __author__, __uri__, __license__, __copyright__
@@ -0,0 +1,110 @@
+import numpy as np
+
+from .utils import _color_message
+
+
+class Accumulator(object):
+    """ Running statistic per agent of a property over windows of timesteps
+
+    Assigned to a property set, the accumulator creates a dynamic property
+    holding the statistic of the latest completed window. The property is
+    written at the end of each window, and at the final timestep for an
+    incomplete window. Accumulators are updated by Campo.write at each
+    timestep, memory use is one value per agent cell.
+
+    To avoid writing the series of the source property it should not be
+    dynamic. Dynamic properties in the property set of the accumulator
+    need the same output schedule, see Property.set_output, otherwise
+    assigning the accumulator raises a ValueError.
+
+    :param prop: source property
+    :type prop: Property
+    :param statistic: 'sum', 'mean', 'min' or 'max'
+    :type statistic: str
+    :param window: number of timesteps per window, None for the whole run
+    :type window: int
+    """
+
+    _statistics = ('sum', 'mean', 'min', 'max')
+
+    def __init__(self, prop, statistic='mean', window=None):
+
+        if statistic not in self._statistics:
+            msg = _color_message(f"Statistic '{statistic}' is not supported, use one of {', '.join(self._statistics)}")
+            raise ValueError(msg)
+
+        if window is not None and window < 1:
+            msg = _color_message(f"Window must be a positive number of timesteps, got {window}")
+            raise ValueError(msg)
+
+        self._prop = prop
+        self._statistic = statistic
+        self._window = window
+
+        # Statistic of the current window so far, one value per agent cell
+        self._state = None
+        self._count = 0
+        self._last_timestep = None
+
+    @property
+    def prop(self):
+        return self._prop
+
+    @property
+    def statistic(self):
+        return self._statistic
+
+    @property
+    def window(self):
+        return self._window
+
+    def update(self, target, timestep, nr_timesteps):
+        """ Adds the current values of the source property, and assigns the
+        statistic to the target property in case the window ends. A
+        repeated update of the same timestep is ignored
+
+        :param target: property holding the statistic
+        :type target: Property
+        :param timestep: current timestep
+        :type timestep: int
+        :param nr_timesteps: number of timesteps of the model
+        :type nr_timesteps: int
+        """
+
+        # Writing a timestep again must not add the values twice
+        if timestep == self._last_timestep:
+            return
+
+        self._last_timestep = timestep
+
+        values, offsets = self._prop.values()._flatten()
+
+        if self._count == 0:
+            self._state = values.astype(np.float64)
+        elif self._statistic in ('sum', 'mean'):
+            self._state += values
+        elif self._statistic == 'min':
+            np.minimum(self._state, values, out=self._state)
+        else:
+            np.maximum(self._state, values, out=self._state)
+
+        self._count += 1
+
+        if timestep != nr_timesteps and (self._window is None or timestep % self._window != 0):
+            return
+
+        result = self._state
+        if self._statistic == 'mean':
+            result = result / self._count
+
+        for idx in range(target.nr_objects):
+            shape = self._prop.values()[idx].shape
+            target.values()[idx] = result[offsets[idx]:offsets[idx + 1]].reshape(shape)
+
+        self._state = None
+        self._count = 0
+
+    def __repr__(self, indent=0):
+        msg = '{}Accumulator: {} of {}'.format('  ' * indent, self._statistic, self._prop.name)
+
+        return msg
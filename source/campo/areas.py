@@ -2,6 +2,7 @@ import csv
 import numpy
 
 from .points import Points
+from .spatialindex import ExtentIndex
 
 
 class Areas(object):
@@ -33,6 +34,8 @@ class Areas(object):
 
         self._epsg = None
 
+        self._extent_index = None
+
     @property
     def epsg(self):
         return self._epsg
@@ -93,6 +96,8 @@ class Areas(object):
             self.row_discr = xdiscr
             self.col_discr = ydiscr
 
+            self._extent_index = None
+
     def __iter__(self):
         return self
 
@@ -115,6 +120,28 @@ class Areas(object):
     def __repr__(self):
         return 'Area'
 
+    def __getstate__(self):
+        # The index is rebuilt on demand, avoid copying it with the domain
+        state = self.__dict__.copy()
+        state['_extent_index'] = None
+        return state
+
+    def extent_index(self):
+        """ Returns an index to locate points in the field agents
+
+        The index is created on first use and shared by all operations on
+        this domain.
+
+        :returns: index for point in field agent queries
+        :rtype: ExtentIndex
+        """
+        if self._extent_index is None:
+            self._extent_index = ExtentIndex(self.p1.xcoord, self.p1.ycoord,
+                                             self.p2.xcoord, self.p2.ycoord,
+                                             self.row_discr, self.col_discr)
+
+        return self._extent_index
+
     def _extent(self, index):
         values = (self.p1.xcoord[index],
                   self.p1.ycoord[index],
@@ -0,0 +1,89 @@
+import io
+import os
+import pickle
+
+import numpy as np
+
+from .values import Values
+
+
+class _Pickler(pickle.Pickler):
+    """ Pickles the model structure, values of agents are collected as flat arrays """
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = {}
+
+    def persistent_id(self, obj):
+
+        if not isinstance(obj, Values):
+            return None
+
+        idx = len(self.arrays)
+        arrays = [obj.values[i] for i in range(obj.nr_objects)]
+
+        try:
+            # Agents with values of the same shape, one row per agent
+            self.arrays[f'values_{idx}'] = np.stack(arrays)
+            return ('values', idx, None)
+        except ValueError:
+            pass
+
+        values, offsets = obj._flatten()
+        self.arrays[f'values_{idx}'] = values
+        self.arrays[f'offsets_{idx}'] = offsets
+        self.arrays[f'shapes_{idx}'] = np.array([array.shape for array in arrays], dtype=np.int64)
+
+        return ('values', idx, 'flat')
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+
+        tag, idx, layout = pid
+        if tag != 'values':
+            raise pickle.UnpicklingError(f"Unknown object '{tag}' in checkpoint")
+
+        values = self.arrays[f'values_{idx}']
+
+        if layout is None:
+            return Values._from_arrays(values)
+
+        offsets = self.arrays[f'offsets_{idx}']
+        shapes = self.arrays[f'shapes_{idx}']
+        arrays = [values[offsets[i]:offsets[i + 1]].reshape(shapes[i]) for i in range(len(shapes))]
+
+        return Values._from_arrays(arrays)
+
+
+def _write_checkpoint(path, state):
+    """ Writes the model state to a NumPy archive, replacing an existing checkpoint only once complete """
+
+    structure = io.BytesIO()
+    pickler = _Pickler(structure)
+    pickler.dump(state)
+
+    arrays = pickler.arrays
+    arrays['structure'] = np.frombuffer(structure.getbuffer(), dtype=np.uint8)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as content:
+        np.savez(content, **arrays)
+
+    os.replace(tmp_path, path)
+
+
+def _read_checkpoint(path):
+    """ Returns the model state from a checkpoint """
+
+    with np.load(path) as content:
+        arrays = {name: content[name] for name in content.files}
+
+    structure = io.BytesIO(arrays.pop('structure').tobytes())
+
+    return _Unpickler(structure, arrays).load()
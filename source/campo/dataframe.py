@@ -13,6 +13,9 @@ warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
 
 import lue.data_model as ldm
 
+from .relation import Relation
+from .utils import _relation_phenomenon
+
 
 def _timeunit_pdname(unit):
     """ Return string representation of time unit """
@@ -24,6 +27,17 @@ def _timeunit_pdname(unit):
     return res
 
 
+def _output_timesteps(time_domain):
+    """ Returns the model timesteps held by the time boxes of a property set
+
+    A box [start, end] holds the timesteps start + 1 to end, e.g. one box
+    holding a time series per object or one box per output timestep.
+    """
+    boxes = time_domain.value[:].astype(np.int64)
+
+    return np.concatenate([np.arange(start + 1, end + 1) for start, end in boxes])
+
+
 def point_agent(object_ids, space_domain):
     obj_idx = int(np.where(object_ids == object_ids[0])[0])
     dom = space_domain.value[:][obj_idx]
@@ -93,7 +107,8 @@ def select_constant_same_shape_arrays(
         else:
             dim = ['id', 'x', 'y']
 
-        da = xr.DataArray(val_sel, coords={'id': sel_oids}, dims=dim)
+        # Model timestep of each column, in case not all timesteps are written
+        da = xr.DataArray(val_sel, coords={'id': sel_oids, 'timestep': ('time', output_timesteps)}, dims=dim)
 
         xr_dataset['values'] = da
 
@@ -211,22 +226,14 @@ def select_variable_same_shape_constant_shape_arrays(
 
     object_tracker = property_set.object_tracker
 
-    object_ids = object_tracker.active_object_id[:]
-
-    assert time_domain.value.nr_boxes == 1
+    # Either one active set holding a time series per object, or
+    # time-major with one active set per timestep holding all objects
+    nr_sets = time_domain.value.nr_boxes
+    nr_objects = len(object_tracker.active_object_id[:]) // nr_sets
 
-    # Construct list of time steps...
-    nr_timesteps = int(time_domain.value[0][1] + 1)
+    object_ids = object_tracker.active_object_id[:nr_objects]
 
-    clock = time_domain.clock
-    epoch = clock.epoch
-    origin = epoch.origin
-    nr_units = clock.nr_units
-
-    keys = { _timeunit_pdname(clock.unit) : nr_units }
-
-    # List of time steps
-    timesteps = pd.date_range(origin, periods=nr_timesteps, freq=pd.DateOffset(**keys) ).values
+    output_timesteps = _output_timesteps(time_domain)
 
     for prop in properties:
         prop_name = prop.id.name
@@ -252,6 +259,9 @@ def select_variable_same_shape_constant_shape_arrays(
 
         # All values go into a dataarray, for selected object IDs
         val = prop.value[:]
+        if val.ndim == 1:
+            # Time-major point values, objects by time
+            val = val.reshape(nr_sets, nr_objects).T
         val_sel = np.take(val, sel_idx, axis=0)
 
         if point_agent(object_ids, space_domain):
@@ -315,12 +325,17 @@ def select_variable_different_shape_constant_shape_arrays(
 
     object_tracker = property_set.object_tracker
 
-    object_ids = object_tracker.active_object_id[:]
+    # Either one active set holding a time series per object, or one
+    # active set per output timestep holding all objects
+    nr_sets = time_domain.value.nr_boxes
+    nr_objects = len(object_tracker.active_object_id[:]) // nr_sets
 
-    assert time_domain.value.nr_boxes == 1
+    object_ids = object_tracker.active_object_id[:nr_objects]
 
     # Construct list of time steps...
-    nr_timesteps = int(time_domain.value[0][1])# + 1
+    output_timesteps = _output_timesteps(time_domain)
+
+    nr_timesteps = int(output_timesteps[-1])
 
     clock = time_domain.clock
     epoch = clock.epoch
@@ -331,6 +346,7 @@ def select_variable_different_shape_constant_shape_arrays(
 
     # List of time steps
     timesteps = pd.date_range(origin, periods=nr_timesteps, freq=pd.DateOffset(**keys) ).values
+    timesteps = timesteps[output_timesteps - 1]
 
     # here we hopefully have object ids, domain, discretisation and values
     # and assume it's 2d space fttb
@@ -376,7 +392,8 @@ def select_variable_different_shape_constant_shape_arrays(
             for c in range(0, int (nr_rows)):
                 y.append(yul + c * y_cellsize)
 
-            da = xr.DataArray(val, coords=[timesteps, y, x], dims=['time', 'ycoord', 'xcoord'])
+            da = xr.DataArray(val, coords={'time': timesteps, 'timestep': ('time', output_timesteps), 'ycoord': y, 'xcoord': x},
+                              dims=['time', 'ycoord', 'xcoord'])
 
             xr_dataset[oid] = da
 
@@ -555,4 +572,62 @@ def coordinates(dataset, phenomenon, propertyset, timestep):
     time_end_idx = time_start_idx + len(object_ids)
 
     vals = lue_pset.space_domain.value[time_start_idx:time_end_idx]
-    return vals
\ No newline at end of file
+    return vals
+
+def select_relation(dataset, phenomenon, propertyset, relation, timestep=None, nr_targets=None):
+    """ Returns a relation written by Campo as Relation
+
+    :param dataset: LUE dataset
+    :param phenomenon: name of the phenomenon
+    :type phenomenon: str
+    :param propertyset: name of the property set holding the relation
+    :type propertyset: str
+    :param relation: name of the relation
+    :type relation: str
+    :param timestep: for dynamic relations the edges as written at or last before
+                     timestep, None for the last written edges
+    :type timestep: int
+    :param nr_targets: number of target agents, defaults to the number of agents
+    :type nr_targets: int
+    """
+
+    nr_agents = len(dataset.phenomena[phenomenon].object_id[:])
+
+    lue_pset = dataset.phenomena[_relation_phenomenon(phenomenon, propertyset, relation)].property_sets['edges']
+
+    selection = slice(None)
+
+    if lue_pset.has_time_domain:
+        timesteps = lue_pset.time_domain.value[:].ravel()
+        set_index = lue_pset.object_tracker.active_set_index[:]
+
+        ends = np.append(set_index[1:], lue_pset.object_tracker.active_object_id.nr_ids)
+
+        # A run resumed from a checkpoint appends edges at timesteps written
+        # before, these replace the edges written at the same or later timesteps
+        later = np.minimum.accumulate(timesteps[::-1])[::-1]
+        valid = np.append(timesteps[:-1] < later[1:], True)
+
+        timesteps = timesteps[valid]
+        set_index = set_index[valid]
+        ends = ends[valid]
+
+        item = len(timesteps) - 1
+        if timestep is not None:
+            item = int(np.searchsorted(timesteps, timestep, side='right')) - 1
+
+        if item < 0:
+            msg = 'No edges written at or before timestep {}'.format(timestep)
+            raise ValueError(msg)
+
+        selection = slice(int(set_index[item]), int(ends[item]))
+
+    sources = lue_pset.properties['source'].value[selection].ravel().astype(np.int64)
+    targets = lue_pset.properties['target'].value[selection].ravel().astype(np.int64)
+    weights = lue_pset.properties['weight'].value[selection].ravel()
+
+    # Edges are written ordered by source agent
+    indptr = np.zeros(nr_agents + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=nr_agents), out=indptr[1:])
+
+    return Relation(nr_agents, indptr, targets, weights, nr_targets, relation)
@@ -1,4 +1,7 @@
+import hashlib
 import os
+import queue
+import threading
 import numpy as np
 
 import pcraster as pcr
@@ -8,11 +11,43 @@ import lue.data_model as ldm
 from .points import Points
 from .areas import Areas
 from .phenomenon import Phenomenon
-from .utils import _color_message
+from .storage import _check_tools, _repack, _timestep_chunks
+from .checkpoint import _write_checkpoint, _read_checkpoint
+from .utils import _color_message, _relation_phenomenon
 
 import campo.config as cc
 
 
+def _point_values(prop):
+    """ Returns the values of all point agents as one array, one row per agent """
+
+    values = prop.values()
+    stacked = np.stack([values.values[idx] for idx in range(prop.nr_objects)])
+
+    if stacked.ndim == 2 and stacked.shape[1] == 1:
+        # Scalar per agent
+        stacked = stacked[:, 0]
+
+    return stacked
+
+
+def _digest(prop):
+    """ Returns a digest of the values of all agents of a property """
+
+    if isinstance(prop.space_domain, Points):
+        arrays = [_point_values(prop)]
+    else:
+        arrays = [prop.values()[idx] for idx in range(prop.nr_objects)]
+
+    digest = hashlib.blake2b()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype}{array.shape}'.encode())
+        digest.update(array.data)
+
+    return digest.digest()
+
+
 class Campo(object):
     """ """
 
@@ -23,12 +58,45 @@ class Campo(object):
         self._lue_time_configuration = None
         self.lue_filename = None
 
+        # Handle of the output dataset, kept open between writes
+        self._lue_dataset = None
+
+        # Storage options for the output dataset, applied by repack
+        self._storage = None
+
+        # Dynamic values per (phenomenon, property set, property) not yet written
+        self._output_buffer = {}
+        self._output_nbytes = 0
+        self._output_buffer_steps = 1
+        self._output_buffer_memory = None
+
+        # Background writer of the output buffer, dataset access is guarded by the lock
+        self._output_asynchronous = False
+        self._output_queue_size = 2
+        self._writer_queue = None
+        self._writer_thread = None
+        self._writer_error = None
+        self._lue_lock = threading.RLock()
+
         self._debug = debug
 
         self._start_timestep = None
         self._clock_unit_value = None
         self._clock_stepsize = None
 
+        # Latest timestep written
+        self._timestep = None
+
+        # Phenomena present in the output dataset
+        self._lue_phenomena = set()
+
+        # Digest of each static property and version of each relation at their last write
+        self._lue_property_digests = {}
+        self._lue_relation_versions = {}
+
+        # Output timesteps of the dynamic properties per property set
+        self._lue_output_timesteps = {}
+
         if seed is None:
             cc.rng = np.random.default_rng()
         else:
@@ -40,6 +108,76 @@ class Campo(object):
             cc.cpus = cpus
             raise NotImplementedError(f"WIP cpus")
 
+    # Model state stored in checkpoints
+    _checkpoint_attributes = [
+        '_phenomena', '_nr_timesteps', '_lue_time_configuration', 'lue_filename', '_storage',
+        '_output_buffer_steps', '_output_buffer_memory', '_output_asynchronous', '_output_queue_size',
+        '_debug', '_start_timestep', '_clock_unit_value', '_clock_stepsize', '_timestep',
+        '_lue_phenomena', '_lue_property_digests', '_lue_relation_versions', '_lue_output_timesteps'
+    ]
+
+    @property
+    def phenomena(self):
+        return self._phenomena
+
+    @property
+    def timestep(self):
+        """ Latest timestep passed to write, None before the dynamic section """
+        return self._timestep
+
+    def checkpoint(self, path):
+        """ Stores the model state to resume a run with restore
+
+        The checkpoint holds the phenomena, property sets, properties and
+        relations, the state of the random number generator, and the
+        latest timestep written. Pending output is written to the LUE
+        dataset first. The random seed of PCRaster operations is not stored.
+
+        :param path: filename of the checkpoint
+        :type path: str
+        """
+
+        self.flush()
+
+        state = {name: getattr(self, name) for name in self._checkpoint_attributes}
+        state['_seed'] = cc.seed
+        state['_rng'] = (type(cc.rng.bit_generator).__name__, cc.rng.bit_generator.state)
+
+        _write_checkpoint(path, state)
+
+    @classmethod
+    def restore(cls, path):
+        """ Returns the model stored in a checkpoint, writing continues
+        in the LUE dataset of the checkpointed model. Output written after
+        the checkpoint is replaced by the resumed run.
+
+        :param path: filename of the checkpoint
+        :type path: str
+        :rtype: Campo
+        """
+
+        state = _read_checkpoint(path)
+
+        ds = cls()
+
+        for name in cls._checkpoint_attributes:
+            setattr(ds, name, state[name])
+
+        # Dynamic relations are written again at the next timestep, replacing
+        # the edges written after the checkpoint. Values of dynamic properties
+        # are stored at fixed positions per timestep and are overwritten
+        if ds._lue_time_configuration is not None:
+            ds._lue_relation_versions = {key: None for key in ds._lue_relation_versions}
+
+        cc.seed = state['_seed']
+
+        name, rng_state = state['_rng']
+        bit_generator = getattr(np.random, name)()
+        bit_generator.state = rng_state
+        cc.rng = np.random.Generator(bit_generator)
+
+        return ds
+
     def __repr__(self, indent=0):
         msg = '{}Campo:\n'.format('  ' * indent)
         if len(self._phenomena) == 0:
@@ -92,27 +230,191 @@ class Campo(object):
 
         return phen
 
-    def create_dataset(self, filename, working_dir=os.getcwd()):
-        """ """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+            return
+
+        # Errors while closing must not mask the exception of the with block,
+        # the background writer is stopped and the dataset released anyway
+        try:
+            self.close()
+        except Exception:
+            try:
+                self._stop_writer()
+            except Exception:
+                pass
+
+            with self._lue_lock:
+                self._lue_dataset = None
+
+    def _dataset(self):
+        """ Returns the handle of the output dataset, reopened in case it was closed """
+
+        if self._lue_dataset is None:
+            if not self.lue_filename:
+                msg = _color_message(f"Dataset filename not yet specified, use create_dataset before")
+                raise RuntimeError(msg)
+
+            self._lue_dataset = ldm.open_dataset(self.lue_filename, 'w')
+
+        return self._lue_dataset
+
+    def _validate(self):
+        with self._lue_lock:
+            self._lue_dataset = None
+            ldm.assert_is_valid(self.lue_filename)
+
+    def flush(self):
+        """ Writes all pending output to disk by writing the output buffer and
+        releasing the dataset handle, the dataset is reopened on the next write
+        """
+
+        self._flush_output()
+        self._stop_writer()
+
+        # HDF5 flushes and closes the file once the last handle is released
+        with self._lue_lock:
+            self._lue_dataset = None
+
+    def close(self):
+        """ Closes the output dataset, e.g. before reading it. Writing again
+        reopens the dataset.
+        """
+
+        self.flush()
+
+    def repack(self):
+        """ Rewrites the output dataset with the storage options of the
+        dataset and its properties
+
+        The LUE API creates datasets with the default HDF5 layout, the
+        storage options are applied by copying the closed dataset with
+        h5repack from the HDF5 tools. This needs disk space for a second
+        copy of the dataset, call it once after the run.
+        """
+
+        if not self.lue_filename:
+            msg = _color_message(f"Dataset filename not yet specified, use create_dataset before")
+            raise RuntimeError(msg)
+
+        self.close()
+
+        properties = []
+        for phen in self._phenomena.values():
+            for pset in phen.property_sets.values():
+                for prop in pset.properties.values():
+                    options = prop.storage if prop.storage is not None else self._storage
+                    if options is None:
+                        continue
+
+                    default_chunks = None
+                    if prop.is_dynamic and isinstance(pset.space_domain, Areas):
+                        # One timestep of a field agent per chunk
+                        default_chunks = _timestep_chunks
+
+                    if prop.storage is not None or (default_chunks is not None and options.chunks is None):
+                        properties.append((phen.name, pset.name, prop.name, options, default_chunks))
+
+        if self._storage is not None or len(properties) > 0:
+            _repack(self.lue_filename, self._storage, properties)
+
+    def set_storage(self, storage):
+        """ Sets the HDF5 storage options for all properties of the output
+        dataset, options of a property are set by its storage attribute.
+        The options are applied by repack, which requires h5py and
+        h5repack from the HDF5 tools.
+
+        :param storage: storage options, None for the default layout
+        :type storage: StorageOptions
+        :raises RuntimeError: in case h5py or h5repack are missing
+        """
+
+        if storage is not None:
+            _check_tools()
+
+        self._storage = storage
+
+    def create_dataset(self, filename, working_dir=os.getcwd(), storage=None):
+        """ Creates the output dataset
+
+        :param filename: name of the LUE dataset
+        :type filename: str
+        :param working_dir: directory of the dataset
+        :type working_dir: str
+        :param storage: HDF5 storage options for all properties, see set_storage
+        :type storage: StorageOptions
+        """
+        self.set_storage(storage)
+
         fpath = os.path.join(working_dir, filename)
 
         root, ext = os.path.splitext(fpath)
         if ext == '':
             fpath += '.lue'
 
+        self.close()
+
         if os.path.exists(filename):
             os.remove(filename)
 
         self.lue_filename = fpath
 
-        ldm.create_dataset(self.lue_filename)
+        self._lue_dataset = ldm.create_dataset(self.lue_filename)
+
+        self._lue_phenomena = set()
+        self._lue_property_digests = {}
+        self._lue_relation_versions = {}
+        self._lue_output_timesteps = {}
 
         if self._debug:
-            ldm.assert_is_valid(self.lue_filename)
+            self._validate()
+
+    def _output_timesteps(self, phen_name, property_set):
+        """ Returns the timesteps at which the dynamic properties of a property set are written
+
+        The LUE time domain is shared by all properties of a property set,
+        properties with different output schedules need separate property sets.
+        The schedule is fixed once the property set is written.
+        """
+
+        key = (phen_name, property_set.name)
+        schedule = tuple((prop.name, prop._output) for prop in property_set.properties.values() if prop.is_dynamic)
+
+        if key in self._lue_output_timesteps:
+            timesteps, written_schedule = self._lue_output_timesteps[key]
+
+            if schedule != written_schedule:
+                msg = _color_message(f"Dynamic properties or output schedules of property set '{property_set.name}' changed after it was written")
+                raise ValueError(msg)
+
+            return timesteps
+
+        schedules = {tuple(prop.output_timesteps(self._nr_timesteps)) for prop in property_set.properties.values() if prop.is_dynamic}
+
+        if len(schedules) > 1:
+            msg = _color_message(f"Dynamic properties of property set '{property_set.name}' have different output schedules, use separate property sets")
+            raise ValueError(msg)
+
+        timesteps = np.arange(1, self._nr_timesteps + 1)
+        if len(schedules) == 1:
+            timesteps = np.array(schedules.pop(), dtype=np.int64)
+
+        if property_set.is_mobile and len(timesteps) != self._nr_timesteps:
+            msg = _color_message(f"Output schedules are not supported for mobile agents, property set '{property_set.name}'")
+            raise NotImplementedError(msg)
+
+        self._lue_output_timesteps[key] = (timesteps, schedule)
+
+        return timesteps
 
     def _generate_lue_property(self, phen_name, property_set, prop):
 
-        dataset = ldm.open_dataset(self.lue_filename, 'w')
+        dataset = self._dataset()
 
         pset = dataset.phenomena[phen_name].property_sets[property_set.name]
 
@@ -123,18 +425,12 @@ class Campo(object):
         if isinstance(property_set.space_domain, Points):
 
             if prop.is_dynamic:
-                time_boxes = 1
-                p_shape = (self._nr_timesteps,)
-                lue_prop = pset.add_property(prop.name, dtype=np.dtype(dtype), shape=p_shape, value_variability=ldm.ValueVariability.variable)
-                lue_prop.value.expand(nr_objects)
-
-                # Just create these once...
-                if pset.object_tracker.active_object_id.nr_ids == 0:
-                    pset.object_tracker.active_object_id.expand(time_boxes * nr_objects)[:] = dataset.phenomena[phen_name].object_id[:]
-                    pset.object_tracker.active_set_index.expand(time_boxes)[:] = 0
-
-                    time_domain = pset.time_domain
-                    time_domain.value.expand(time_boxes)[:] = np.array([0, self._nr_timesteps])
+                # Time-major, the values of all agents per active set of a timestep
+                # follow each other such that each timestep is written as one slice,
+                # for stationary and mobile agents.
+                # The object tracker is created with the property set
+                lue_prop = pset.add_property(prop.name, dtype=np.dtype(dtype), value_variability=ldm.ValueVariability.variable)
+                lue_prop.value.expand(len(self._output_timesteps(phen_name, property_set)) * nr_objects)
             else:
                 lue_prop = pset.add_property(prop.name, dtype=np.dtype(dtype))
                 lue_prop.value.expand(nr_objects)
@@ -142,18 +438,29 @@ class Campo(object):
         elif isinstance(property_set.space_domain, Areas):
 
             if prop.is_dynamic:
-                time_boxes = 1
                 lue_prop = pset.add_property(prop.name, dtype=np.dtype(dtype), rank=2,
                   shape_per_object=ldm.ShapePerObject.different,
                   shape_variability=ldm.ShapeVariability.constant)
 
+                timesteps = self._output_timesteps(phen_name, property_set)
+
                 # Just create these once...
                 if pset.object_tracker.active_object_id.nr_ids == 0:
-                    pset.object_tracker.active_object_id.expand(time_boxes * nr_objects)[:] = dataset.phenomena[phen_name].object_id[:]
-                    pset.object_tracker.active_set_index.expand(time_boxes)[:] = 0
-
+                    object_ids = dataset.phenomena[phen_name].object_id[:]
                     time_domain = pset.time_domain
-                    time_domain.value.expand(time_boxes)[:] = np.array([0, self._nr_timesteps])
+
+                    if len(timesteps) == self._nr_timesteps:
+                        # One active set holding a time series per agent
+                        time_boxes = 1
+                        pset.object_tracker.active_object_id.expand(time_boxes * nr_objects)[:] = object_ids
+                        pset.object_tracker.active_set_index.expand(time_boxes)[:] = 0
+                        time_domain.value.expand(time_boxes)[:] = np.array([0, self._nr_timesteps])
+                    else:
+                        # One active set per output timestep
+                        time_boxes = len(timesteps)
+                        pset.object_tracker.active_object_id.expand(time_boxes * nr_objects)[:] = np.tile(object_ids, time_boxes)
+                        pset.object_tracker.active_set_index.expand(time_boxes)[:] = np.arange(time_boxes) * nr_objects
+                        time_domain.value.expand(time_boxes)[:] = np.column_stack((timesteps - 1, timesteps))
             else:
                 # Same shape
                 # prop = pset.add_property(property_name, dtype=np.dtype(dtype), shape=shape)
@@ -177,7 +484,7 @@ class Campo(object):
             rank = 2
             if prop.is_dynamic:
                 for idx, item in enumerate(property_set.space_domain):
-                    lue_prop.value.expand(idx, tuple([item[4], item[5]]), self._nr_timesteps)
+                    lue_prop.value.expand(idx, tuple([item[4], item[5]]), len(timesteps))
             else:
                 shapes = np.zeros(nr_objects * rank, dtype=ldm.dtype.Count).reshape(nr_objects, rank)
 
@@ -194,14 +501,12 @@ class Campo(object):
         else:
             raise NotImplementedError
 
-        dataset = None
-
         if self._debug:
-            ldm.assert_is_valid(self.lue_filename)
+            self._validate()
 
     def _generate_lue_property_set(self, phen_name, property_set):
 
-        dataset = ldm.open_dataset(self.lue_filename, 'w')
+        dataset = self._dataset()
 
         rank = -1
         space_type = None
@@ -262,10 +567,22 @@ class Campo(object):
             time_boxes = 1
 
             if tmp_pset.object_tracker.active_object_id.nr_ids == 0:
-                tmp_pset.object_tracker.active_object_id.expand(time_boxes * nr_timesteps_and_objects)[:] = np.arange(nr_timesteps_and_objects)
-                tmp_pset.object_tracker.active_set_index.expand(time_boxes)[:] = 0
-                time_domain = tmp_pset.time_domain
-                time_domain.value.expand(time_boxes)[:] = np.array([0, self._nr_timesteps])
+                if property_set.is_mobile or any(prop.is_dynamic for prop in property_set.properties.values()):
+                    # Time-major, one active set per output timestep holding all agents,
+                    # coordinates of mobile agents follow the same order
+                    timesteps = self._output_timesteps(phen_name, property_set)
+                    time_boxes = len(timesteps)
+                    nr_objects = property_set.nr_objects
+                    object_ids = dataset.phenomena[phen_name].object_id[:]
+                    tmp_pset.object_tracker.active_object_id.expand(time_boxes * nr_objects)[:] = np.tile(object_ids, time_boxes)
+                    tmp_pset.object_tracker.active_set_index.expand(time_boxes)[:] = np.arange(time_boxes) * nr_objects
+                    time_domain = tmp_pset.time_domain
+                    time_domain.value.expand(time_boxes)[:] = np.column_stack((timesteps - 1, timesteps))
+                else:
+                    tmp_pset.object_tracker.active_object_id.expand(time_boxes * nr_timesteps_and_objects)[:] = np.arange(nr_timesteps_and_objects)
+                    tmp_pset.object_tracker.active_set_index.expand(time_boxes)[:] = 0
+                    time_domain = tmp_pset.time_domain
+                    time_domain.value.expand(time_boxes)[:] = np.array([0, self._nr_timesteps])
 
         elif space_type == ldm.SpaceDomainItemType.box:
 
@@ -294,17 +611,15 @@ class Campo(object):
         for prop in property_set.properties.values():
             self._generate_lue_property(phen_name, property_set, prop)
 
-        dataset = None
-
         if self._debug:
-            ldm.assert_is_valid(self.lue_filename)
+            self._validate()
 
     def _generate_lue_phenomenon(self,  phenomenon):
         pset = next(iter(phenomenon.property_sets.values()))
 
         nr_objects = pset.nr_objects
 
-        dataset = ldm.open_dataset(self.lue_filename, 'w')
+        dataset = self._dataset()
 
         dataset.add_phenomenon(phenomenon.name)
         tmp = dataset.phenomena[phenomenon.name]
@@ -313,67 +628,317 @@ class Campo(object):
         for p in phenomenon.property_sets.values():
             self._generate_lue_property_set(phenomenon.name, p)
 
-        dataset = None
+        if self._debug:
+            self._validate()
+
+    def _generate_lue_relation(self, dataset, rel_phen_name):
+        """ Adds a phenomenon holding the edges of a relation, one object per edge """
+
+        dataset.add_phenomenon(rel_phen_name)
+        phen = dataset.phenomena[rel_phen_name]
+
+        if self._lue_time_configuration is None:
+            pset = phen.add_property_set('edges')
+            value_variability = ldm.ValueVariability.constant
+        else:
+            # Edge lists per written timestep
+            epoch = ldm.Epoch(ldm.Epoch.Kind.common_era, self._start_timestep, ldm.Calendar.gregorian)
+            clock = ldm.Clock(epoch, self._clock_unit_value, self._clock_stepsize)
+            time_configuration = ldm.TimeConfiguration(ldm.TimeDomainItemType.point)
+            pset = phen.add_property_set('edges', time_configuration, clock)
+            value_variability = ldm.ValueVariability.variable
+
+        for name, dtype in [('source', ldm.dtype.ID), ('target', ldm.dtype.ID), ('weight', np.float64)]:
+            pset.add_property(name, dtype=np.dtype(dtype), shape=(1,), value_variability=value_variability)
+
+    def _lue_write_relation(self, phen_name, pset, relation, timestep):
+        """ Writes the edges of a relation in case it changed since the previous write
+
+        Edges are stored as objects with a source, target and weight. For
+        dynamic models each write appends the edge list as active set at
+        the timestep, static models store one edge list.
+        """
+
+        key = (phen_name, pset.name, relation.name)
+        static = self._lue_time_configuration is None
+
+        # A relation assigned under the same name is another instance
+        version = (relation.uuid, relation.version)
+
+        if key in self._lue_relation_versions:
+            if static or timestep is None or self._lue_relation_versions[key] == version:
+                return
+
+        with self._lue_lock:
+            self._lue_write_edges(phen_name, pset, relation, timestep, static)
+
+        self._lue_relation_versions[key] = version
 
         if self._debug:
-            ldm.assert_is_valid(self.lue_filename)
+            self._validate()
+
+    def _lue_write_edges(self, phen_name, pset, relation, timestep, static):
+
+        dataset = self._dataset()
+
+        rel_phen_name = _relation_phenomenon(phen_name, pset.name, relation.name)
+
+        if rel_phen_name not in dataset.phenomena.names:
+            self._generate_lue_relation(dataset, rel_phen_name)
+
+        rel_phen = dataset.phenomena[rel_phen_name]
+        lue_pset = rel_phen.property_sets['edges']
+
+        nr_edges = relation.nr_edges
+        values = {
+            'source': relation.sources().astype(ldm.dtype.ID),
+            'target': relation.indices.astype(ldm.dtype.ID),
+            'weight': relation.weights
+        }
+
+        first_id = 0
+        if not static:
+            first_id = lue_pset.object_tracker.active_object_id.nr_ids
+
+            lue_pset.object_tracker.active_set_index.expand(1)[-1] = first_id
+            lue_pset.time_domain.value.expand(1)[-1] = 0 if timestep is None else timestep
+
+        if nr_edges > 0:
+            object_ids = np.arange(first_id, first_id + nr_edges, dtype=ldm.dtype.ID)
+            rel_phen.object_id.expand(nr_edges)[-nr_edges:] = object_ids
+
+            if not static:
+                lue_pset.object_tracker.active_object_id.expand(nr_edges)[-nr_edges:] = object_ids
+
+            for name, value in values.items():
+                lue_pset.properties[name].value.expand(nr_edges)[-nr_edges:] = value.reshape(nr_edges, 1)
 
     def _lue_write_property(self, phen_name, pset, prop, timestep):
-        dataset = ldm.open_dataset(self.lue_filename, 'w')
+        """ Writes static property values, dynamic values are passed to the output buffer """
 
-        # todo restructure this method...
+        if pset._lue_filename is None:
+            pset._lue_filename = self.lue_filename
+
+        key = (phen_name, pset.name, prop.name)
+
+        if prop.is_dynamic:
+            if timestep is None:
+                return
 
-        # if possible return without performing disk access
-        if not prop.is_dynamic:
-            # do not write 'static' data in dynamic section
-            if timestep is not None:
+            # Position of the timestep in the output
+            timesteps = self._output_timesteps(phen_name, pset)
+            position = np.searchsorted(timesteps, timestep)
+            if position == len(timesteps) or timesteps[position] != timestep:
                 return
 
+            # Values can be modified in place, a copy is taken at each write
+            self._buffer_output(phen_name, pset, prop.name, int(position), self._snapshot(prop))
+            return
+
+        # do not write 'static' data in dynamic section
+        if timestep is not None:
+            return
+
+        # Skip values equal to the ones written before
+        digest = _digest(prop)
+        if self._lue_property_digests.get(key) == digest:
+            return
+
+        with self._lue_lock:
+            self._lue_write_static(phen_name, pset, prop)
+
+        self._lue_property_digests[key] = digest
+
+    def _lue_write_static(self, phen_name, pset, prop):
+
+        dataset = self._dataset()
+
         lue_pset = dataset.phenomena[phen_name].property_sets[pset.name]
         object_ids = dataset.phenomena[phen_name].object_id[:]
 
-        if pset._lue_filename is None:
-            pset._lue_filename = self.lue_filename
+        lue_prop = lue_pset.properties[prop.name]
+        if isinstance(prop.space_domain, Points):
+            lue_prop.value[:] = _point_values(prop)
+        elif isinstance(prop.space_domain, Areas):
+            for idx, val in enumerate(prop.values().values):
+                lue_prop.value[object_ids[idx]][:] = prop.values().values[idx]
+        else:
+            raise NotImplementedError
 
-        # Agents mobile during time
-        if(pset.is_mobile and timestep is not None):
-            coord_start_idx = len(object_ids) * (timestep - 1)
-            coord_end_idx = coord_start_idx + len(object_ids)
-
-            campo_pset = self._phenomena[phen_name].property_sets[pset.name]
-            campo_coords_ts = campo_pset.space_domain._get_coordinates()
-
-            lue_pset.space_domain.value[coord_start_idx:coord_end_idx] = campo_coords_ts
-
-        # Writing property values
-        if not prop.is_dynamic:
-            lue_prop = lue_pset.properties[prop.name]
-            if isinstance(prop.space_domain, Points):
-                for idx, val in enumerate(prop.values().values):
-                    lue_prop.value[idx] = prop.values().values[idx]
-            elif isinstance(prop.space_domain, Areas):
-                for idx, val in enumerate(prop.values().values):
-                    lue_prop.value[object_ids[idx]][:] = prop.values().values[idx]
-            else:
-                raise NotImplementedError
+        if self._debug:
+            self._validate()
+
+    def _snapshot(self, prop):
+        """ Returns a copy of the current values of a property """
 
+        if isinstance(prop.space_domain, Points):
+            return _point_values(prop)
+        elif isinstance(prop.space_domain, Areas):
+            return [np.array(prop.values().values[idx]) for idx in range(prop.nr_objects)]
         else:
-            if timestep is not None:
-                lue_prop = lue_pset.properties[prop.name]
-                if isinstance(prop.space_domain, Points):
-                    for idx, val in enumerate(prop.values().values):
-                        #lue_prop.value[:][idx, timestep - 1] = prop.values().values[idx]
-                        tmp = lue_prop.value[idx]
-                        tmp[timestep - 1] = prop.values().values[idx]
-                        lue_prop.value[idx] = tmp
-                else:
-                    for idx, val in enumerate(prop.values().values):
-                        lue_prop.value[object_ids[idx]][timestep - 1] = prop.values().values[idx]
+            raise NotImplementedError
 
-        dataset = None
+    def _buffer_output(self, phen_name, pset, prop_name, position, values):
+        """ Adds values to the output buffer, position is the index of the
+        timestep in the output, prop_name None indicates coordinates of
+        mobile agents
+        """
 
-        if self._debug:
-            ldm.assert_is_valid(self.lue_filename)
+        key = (phen_name, pset.name, prop_name)
+        positions, buffered = self._output_buffer.setdefault(key, ([], []))
+
+        # Blocks hold consecutive positions only
+        if len(positions) > 0 and positions[-1] != position - 1:
+            self._flush_output()
+            positions, buffered = self._output_buffer.setdefault(key, ([], []))
+
+        positions.append(position)
+        buffered.append(values)
+
+        if isinstance(values, list):
+            self._output_nbytes += sum(item.nbytes for item in values)
+        else:
+            self._output_nbytes += values.nbytes
+
+    def _output_buffer_full(self):
+
+        nr_timesteps = max([len(positions) for positions, values in self._output_buffer.values()], default=0)
+
+        if nr_timesteps >= self._output_buffer_steps:
+            return True
+
+        return self._output_buffer_memory is not None and self._output_nbytes >= self._output_buffer_memory
+
+    def _flush_output(self):
+        """ Writes the output buffer, or passes it to the background writer """
+
+        if len(self._output_buffer) == 0:
+            return
+
+        buffer = self._output_buffer
+        self._output_buffer = {}
+        self._output_nbytes = 0
+
+        if not self._output_asynchronous:
+            self._write_output(buffer)
+            return
+
+        if self._writer_thread is None:
+            self._writer_queue = queue.Queue(maxsize=self._output_queue_size)
+            self._writer_thread = threading.Thread(target=self._writer_loop, name='campo-writer', daemon=True)
+            self._writer_thread.start()
+
+        # Blocks in case the writer is behind by queue_size buffers
+        self._writer_queue.put(buffer)
+
+    def _writer_loop(self):
+        """ Writes buffers from the queue in order until None is received,
+        buffers following an error are discarded
+        """
+
+        while True:
+            buffer = self._writer_queue.get()
+            if buffer is None:
+                return
+
+            if self._writer_error is None:
+                try:
+                    self._write_output(buffer)
+                except Exception as error:
+                    self._writer_error = error
+
+    def _stop_writer(self):
+        """ Waits until the background writer wrote all buffers """
+
+        if self._writer_thread is not None:
+            self._writer_queue.put(None)
+            self._writer_thread.join()
+            self._writer_thread = None
+            self._writer_queue = None
+
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+
+        if self._writer_error is not None:
+            error = self._writer_error
+            self._writer_error = None
+            raise error
+
+    def _write_output(self, buffer):
+        """ Writes buffered values, one block per property """
+
+        with self._lue_lock:
+            self._write_blocks(buffer)
+
+            if self._debug:
+                self._validate()
+
+    def _write_blocks(self, buffer):
+
+        dataset = self._dataset()
+
+        for (phen_name, pset_name, prop_name), (positions, values) in buffer.items():
+            pset = self._phenomena[phen_name].property_sets[pset_name]
+            lue_pset = dataset.phenomena[phen_name].property_sets[pset_name]
+
+            first = positions[0]
+            nr_steps = len(positions)
+            nr_objects = pset.nr_objects
+
+            if prop_name is None:
+                # Coordinates of mobile agents per timestep
+                lue_pset.space_domain.value[first * nr_objects:(first + nr_steps) * nr_objects] = np.concatenate(values)
+                continue
+
+            lue_prop = lue_pset.properties[prop_name]
+
+            if isinstance(pset.space_domain, Points):
+                lue_prop.value[first * nr_objects:(first + nr_steps) * nr_objects] = np.concatenate(values)
+            else:
+                # One array per field agent in LUE, each is written separately
+                object_ids = dataset.phenomena[phen_name].object_id[:]
+                for idx in range(nr_objects):
+                    if nr_steps == 1:
+                        lue_prop.value[object_ids[idx]][first] = values[0][idx]
+                    else:
+                        lue_prop.value[object_ids[idx]][first:first + nr_steps] = np.stack([item[idx] for item in values])
+
+    def set_output_buffer(self, steps=1, memory=None, asynchronous=False, queue_size=2):
+        """ Keeps dynamic output in memory and writes it as blocks of timesteps
+
+        The buffer is written once it holds the given number of timesteps
+        or exceeds the memory budget, and on flush and close.
+        Asynchronous output is written by a background thread while the
+        model continues, write blocks once queue_size buffers are pending.
+        Errors of the background writer are raised by the next write,
+        flush or close.
+
+        :param steps: number of timesteps to buffer
+        :type steps: int
+        :param memory: maximum size of the buffered values in bytes
+        :type memory: int
+        :param asynchronous: write buffers in a background thread
+        :type asynchronous: bool
+        :param queue_size: maximum number of buffers waiting to be written
+        :type queue_size: int
+        """
+
+        if steps < 1:
+            msg = _color_message(f"Number of buffered timesteps must be positive, got {steps}")
+            raise ValueError(msg)
+
+        if queue_size < 1:
+            msg = _color_message(f"Size of the output queue must be positive, got {queue_size}")
+            raise ValueError(msg)
+
+        self._flush_output()
+        self._stop_writer()
+
+        self._output_buffer_steps = steps
+        self._output_buffer_memory = memory
+        self._output_asynchronous = asynchronous
+        self._output_queue_size = queue_size
 
     def write(self, timestep=None):
         """ Writing current state to a LUE dataset
@@ -384,19 +949,41 @@ class Campo(object):
             msg = _color_message(f"Number of timesteps not yet specified, use set_time")
             raise RuntimeError(msg)
 
-        dataset = ldm.open_dataset(self.lue_filename, 'r')
-        # Get list of phenomena such that we can close the dataset immediately
-        dataset_phenomena = dataset.phenomena.names
-        dataset = None
+        self._raise_writer_error()
+
+        if timestep is not None:
+            self._timestep = timestep
+
+            for phen in self._phenomena.values():
+                for pset in phen.property_sets.values():
+                    for name, accumulator in pset.accumulators.items():
+                        accumulator.update(pset.properties[name], timestep, self._nr_timesteps)
 
-        for p in self._phenomena:
-            if not p in dataset_phenomena:
-                self._generate_lue_phenomenon(self._phenomena[p])
+        new_phenomena = [p for p in self._phenomena if p not in self._lue_phenomena]
+
+        if len(new_phenomena) > 0:
+            with self._lue_lock:
+                dataset_phenomena = self._dataset().phenomena.names
+
+                for p in new_phenomena:
+                    if not p in dataset_phenomena:
+                        self._generate_lue_phenomenon(self._phenomena[p])
+                    self._lue_phenomena.add(p)
 
         for phen in self._phenomena:
             for pset in self._phenomena[phen].property_sets.values():
+                # Agents mobile during time
+                if pset.is_mobile and timestep is not None:
+                    coordinates = np.array(pset.space_domain._get_coordinates())
+                    self._buffer_output(phen, pset, None, timestep - 1, coordinates)
+
                 for prop in pset.properties.values():
                     self._lue_write_property(phen, pset, prop, timestep)
+                for relation in pset.relations.values():
+                    self._lue_write_relation(phen, pset, relation, timestep)
+
+        if self._output_buffer_full():
+            self._flush_output()
 
     def set_time(self, start, unit, stepsize, nrTimeSteps):
         """  """
@@ -415,7 +1002,7 @@ class Campo(object):
         self._lue_time_configuration = True
         time_configuration = ldm.TimeConfiguration(ldm.TimeDomainItemType.box)
 
-        dataset = ldm.open_dataset(self.lue_filename, 'w')
+        dataset = self._dataset()
         dataset.add_phenomenon('framework')
         tmp = dataset.phenomena['framework']
 
@@ -431,7 +1018,5 @@ class Campo(object):
         time_cell.object_tracker.active_set_index.expand(time_boxes)[:] = 0
         time_cell.time_domain.value.expand(time_boxes)[:] = np.array([0, self._nr_timesteps])
 
-        dataset = None
-
         if self._debug:
-            ldm.assert_is_valid(self.lue_filename)
+            self._validate()
@@ -1,4 +1,7 @@
 from .rasterize import *
 from .focal import *
 from .network import *
+from .proximity import *
+from .sampling import *
+from .zonal import *
 from .export import *
@@ -5,6 +5,7 @@ import tempfile
 import shutil
 
 from osgeo import gdal, osr
+import numpy as np
 import pandas as pd
 
 from ..dataframe import *
@@ -13,6 +14,19 @@ from ..utils import _color_message
 gdal.UseExceptions()
 
 
+def _timestep_index(values, timestep):
+    """ Returns the index of a model timestep along the time axis of dynamic values """
+
+    timesteps = values.coords['timestep'].values
+    idx = np.searchsorted(timesteps, timestep)
+
+    if idx == len(timesteps) or timesteps[idx] != timestep:
+        msg = _color_message(f'Timestep {timestep} is not part of the output, written timesteps are {list(timesteps)}')
+        raise ValueError(msg)
+
+    return idx
+
+
 def to_df(dataframe, timestep=None):
     """ Exports point agent properties to a Pandas dataframe
 
@@ -74,7 +88,7 @@ def to_df(dataframe, timestep=None):
                 for prop_name in property_names:
                     p = dataframe[phen_name][pset_name][prop_name]
                     # User provided timestep to array index
-                    ts = timestep - 1
+                    ts = _timestep_index(p['values'], timestep)
                     dfObj[prop_name] = p['values'].values[:, ts]
 
                     return dfObj
@@ -213,7 +227,7 @@ def to_gpkg(dataframe, filename, crs='', timestep=None):
                 for prop_name in property_names:
                     p = dataframe[phen_name][pset_name][prop_name]
                     # User provided timestep to array index
-                    ts = timestep - 1
+                    ts = _timestep_index(p['values'], timestep)
                     dfObj[prop_name] = p['values'].values[:, ts]
 
                 with tempfile.TemporaryDirectory() as tmpdir:
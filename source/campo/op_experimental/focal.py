@@ -1,8 +1,5 @@
 import copy
 import numpy
-import math
-import multiprocessing
-from concurrent import futures
 
 
 from osgeo import ogr
@@ -10,8 +7,6 @@ from osgeo import osr
 
 ogr.UseExceptions()
 
-import pcraster
-
 from ..property import Property
 from ..points import Points
 from ..areas import Areas
@@ -179,135 +174,6 @@ def focal_average_others(start_prop, dest_prop, value_prop, buffer_size, default
     return tmp_prop
 
 
-def _focal_agents(values):
-#(idx, tmp_prop, nr_locs, values_weight, extent, spatial_ref, lyr_dst, operation, fail, dest_prop, point_crs, d_domain, d_values)
-    idx = values[0]
-    #tmp_prop = values[1]
-    nr_locs = values[2]
-    values_weight = values[3]
-    extent = values[4]
-    #spatial_ref = values[5]
-    #lyr_dst = values[6]
-    #operation = values[7]
-    fail = values[8]
-    #dest_prop = values[9]
-    crs = values[10]
-    d_domain = values[11]
-    d_values = values[12]
-
-    spatial_ref = osr.SpatialReference()
-    spatial_ref.ImportFromEPSG(crs)
-
-    ds = ogr.GetDriverByName('MEMORY').CreateDataSource(f'mem{idx}')
-
-    # Second we make a point feature from which we will obtain the locations
-    # Holding all objects
-    lname = f'locations{idx}'
-    lyr_dst = ds.CreateLayer(lname, geom_type=ogr.wkbPoint, srs=spatial_ref)
-
-    field = ogr.FieldDefn('value', ogr.OFTReal)
-    lyr_dst.CreateField(field)
-
-    for pidx, p in enumerate(d_domain):
-        point = ogr.Geometry(ogr.wkbPoint)
-
-        point.AddPoint(p[0], p[1])
-        feat = ogr.Feature(lyr_dst.GetLayerDefn())
-        feat.SetGeometry(point)
-        val = None
-        try:
-            val = d_values[pidx][0]
-        except:
-            val = d_values[pidx]
-
-        assert val
-        feat.SetField('value', float(val))
-
-        lyr_dst.CreateFeature(feat)
-        feat = None
-        point = None
-
-    lyr_dst = None
-    lyr_dst = ds.GetLayer(lname)
-
-    # Raster for points to query
-    nr_rows = extent[4]
-    nr_cols = extent[5]
-    cellsize = math.fabs(extent[2] - extent[0]) / nr_cols
-
-    #
-    minX = extent[0]
-    maxX = extent[2]
-    minY = extent[1]
-    maxY = extent[3]
-
-    extent_lyr = ds.CreateLayer('extent', geom_type=ogr.wkbPolygon,  srs=spatial_ref)
-    assert extent_lyr
-
-    feat = ogr.Feature(extent_lyr.GetLayerDefn())
-
-    ring = ogr.Geometry(ogr.wkbLinearRing)
-
-    ring.AddPoint(minX, maxY)
-    ring.AddPoint(maxX, maxY)
-    ring.AddPoint(maxX, minY)
-    ring.AddPoint(minX, minY)
-    ring.AddPoint(minX, maxY)
-
-    poly = ogr.Geometry(ogr.wkbPolygon)
-    poly.AddGeometry(ring)
-
-    feat.SetGeometry(poly)
-    extent_lyr.CreateFeature(feat)
-
-    intersect_layer = ds.CreateLayer('intersect', geom_type=ogr.wkbPoint, srs=spatial_ref)
-    assert intersect_layer
-
-    lyr_dst.Intersection(extent_lyr, intersect_layer)
-
-    pcraster.setclone(nr_rows, nr_cols, cellsize, minX, maxY)
-
-    raster = pcraster.numpy2pcr(pcraster.Scalar, values_weight.astype("float32"), numpy.nan)
-
-    point_values = numpy.empty(nr_locs)
-    point_values.fill(numpy.nan)
-    weight_values = numpy.empty(nr_locs)
-    weight_values.fill(numpy.nan)
-
-    for iidx, feature in enumerate(intersect_layer):
-        x = feature.GetGeometryRef().GetX()
-        y = feature.GetGeometryRef().GetY()
-
-        try:
-            # Only add points that are 'valid' PCRaster points
-            # coordinate lookup might fail if point returned by gdal is on lower and right border
-            field_value, valid = pcraster.cellvalue_by_coordinates(raster, x, y)
-            point_value = feature.GetField('value')
-            if valid:
-                point_values[iidx] = point_value
-                weight_values[iidx] = field_value
-        except:
-            pass
-
-    indices = ~numpy.isnan(point_values)
-    masked_points = point_values[indices]
-    masked_weights = weight_values[indices]
-
-    result = numpy.nan
-
-    if len(masked_weights) > 0:
-        try:
-            result = numpy.average(masked_points, weights=masked_weights)
-        except ZeroDivisionError as r:
-            msg = _color_message(f'AgentID {idx}: {r}')
-            raise ZeroDivisionError(msg)
-
-    if fail == True:
-        assert not numpy.isnan(result)
-
-    return idx, result
-
-
 def focal_agents(dest, weight, source, fail=False):
     """
 
@@ -316,6 +182,11 @@ def focal_agents(dest, weight, source, fail=False):
     weight: field property (weight/mask)
 
     source: point property (values to gather from)
+
+    For each field agent the average of the source values located in its
+    extent is calculated, weighted by the field value at each location.
+    Locations are obtained in one pass from the extent index of the field
+    domain.
     """
 
     # hack rename...
@@ -352,146 +223,41 @@ def focal_agents(dest, weight, source, fail=False):
 
     assert dst_crs == field_crs
 
-    tmp_prop = Property('emptyfocal_agents', dest.uuid, dest.space_domain, dest.shapes, numpy.nan)
-
-    #spatial_ref = osr.SpatialReference()
-    #spatial_ref.ImportFromEPSG(point_crs)
+    index = source_field.space_domain.extent_index()
+    d_domain = dest_prop.space_domain
 
-    #ds = ogr.GetDriverByName('MEMORY').CreateDataSource('mem')
+    points, agents, rows, cols = index.query(d_domain.xcoord, d_domain.ycoord)
 
-    ## Second we make a point feature from which we will obtain the locations
-    ## Holding all objects
-    #lyr_dst = ds.CreateLayer('locations', geom_type=ogr.wkbPoint, srs=spatial_ref)
+    field_values, field_offsets = source_field.values()._flatten()
+    point_values, point_offsets = dest_prop.values()._flatten()
 
-    #field = ogr.FieldDefn('value', ogr.OFTReal)
-    #lyr_dst.CreateField(field)
+    weights = field_values[field_offsets[agents] + rows * index.nr_cols[agents] + cols].astype(numpy.float64)
+    values = point_values[point_offsets[points]].astype(numpy.float64)
 
-    #for idx, p in enumerate(dest_prop.space_domain):
-        #point = ogr.Geometry(ogr.wkbPoint)
+    valid = ~numpy.isnan(weights) & ~numpy.isnan(values)
+    agents = agents[valid]
+    weights = weights[valid]
+    values = values[valid]
 
-        #point.AddPoint(p[0], p[1])
-        #feat = ogr.Feature(lyr_dst.GetLayerDefn())
-        #feat.SetGeometry(point)
+    nr_agents = source_point.nr_objects
 
-        #try:
-            #val = dest_prop.values()[idx][0]
-        #except:
-            #val = dest_prop.values()[idx]
+    counts = numpy.bincount(agents, minlength=nr_agents)
+    weight_sums = numpy.bincount(agents, weights=weights, minlength=nr_agents)
+    value_sums = numpy.bincount(agents, weights=weights * values, minlength=nr_agents)
 
-        #feat.SetField('value', float(val))
+    located = counts > 0
+    zero_weights = numpy.flatnonzero(located & (weight_sums == 0))
+    if len(zero_weights) > 0:
+        msg = _color_message(f"AgentID {zero_weights[0]}: Weights sum to zero, can't be normalized")
+        raise ZeroDivisionError(msg)
 
-        #lyr_dst.CreateFeature(feat)
+    result = numpy.full(nr_agents, numpy.nan)
+    result[located] = value_sums[located] / weight_sums[located]
 
-    #lyr_dst = None
-    #lyr_dst = ds.GetLayer('locations')
-
-    nr_locs = dest_prop.nr_objects
-
-    todos = []
-    for idx, p in enumerate(source_point.space_domain):
-        values_weight = source_field.values()[idx]
-
-        extent = source_field.space_domain._extent(idx)
-
-        d_domain = dest_prop.space_domain
-        d_values = dest_prop.values()
-
-        item = (idx, 'tmp_prop', nr_locs, values_weight, extent, 'spatial_ref', 'lyr_dst', 'operation', fail, 'dprop', point_crs, d_domain, d_values)
-        todos.append(item)
-
-    cpus = multiprocessing.cpu_count()
-    tasks = len(todos)
-    chunks = max(1, tasks // cpus)
-
-    with futures.ProcessPoolExecutor(max_workers=cpus) as ex:
-        results = ex.map(_focal_agents, todos, chunksize=chunks)
-
-    for result in results:
-        tmp_prop.values().values[result[0]] = result[1]
-
-    return tmp_prop
-    # sequential #
-
-    nr_locs = dest_prop.nr_objects
-
-    point_values = numpy.empty(nr_locs)
-    point_values.fill(numpy.nan)
-
-    for idx, p in enumerate(source_point.space_domain):
-        values_weight = source_field.values()[idx]
-
-        extent = source_field.space_domain._extent(idx)
-
-        # Raster for points to query
-        nr_rows = extent[4]
-        nr_cols = extent[5]
-        cellsize = math.fabs(extent[2] - extent[0]) / nr_cols
-
-        minX = extent[0]
-        maxY = extent[3]
-
-        #if ds.GetLayerByName('extent'):
-        #      ds.DeleteLayer('extent')
-        #ds.DeleteLayer('extent')
-
-        ds_extent = ogr.GetDriverByName('MEMORY').CreateDataSource('ds_extent')
-
-        extent_lyr = ds_extent.CreateLayer('extent', geom_type=ogr.wkbPolygon,  srs=spatial_ref)
-
-        feat = ogr.Feature(extent_lyr.GetLayerDefn())
-
-        ring = ogr.Geometry(ogr.wkbLinearRing)
-
-        ring.AddPoint(minX, maxY)
-        ring.AddPoint(minX + nr_cols * cellsize, maxY)
-        ring.AddPoint(minX + nr_cols * cellsize, maxY - nr_rows * cellsize)
-        ring.AddPoint(minX, maxY - nr_rows * cellsize)
-        ring.AddPoint(minX, maxY)
-
-        poly = ogr.Geometry(ogr.wkbPolygon)
-        poly.AddGeometry(ring)
-
-        feat.SetGeometry(poly)
-        extent_lyr.CreateFeature(feat)
-
-        #if ds.GetLayerByName('intersect'):
-        #      ds.DeleteLayer('intersect')
-
-        intersect_layer = ds_extent.CreateLayer('locations', geom_type=ogr.wkbPoint, srs=spatial_ref)
-
-        lyr_dst.Intersection(extent_lyr, intersect_layer)
-
-        pcraster.setclone(nr_rows, nr_cols, cellsize, minX, maxY)
-
-        raster = pcraster.numpy2pcr(pcraster.Scalar, values_weight.astype("float32"), numpy.nan)
-
-        point_values.fill(numpy.nan)
-
-        for idx, feature in enumerate(intersect_layer):
-            x = feature.GetGeometryRef().GetX()
-            y = feature.GetGeometryRef().GetY()
-
-            mask_value, valid = pcraster.cellvalue_by_coordinates(raster, x, y)
-            agent_value = feature.GetField('value')
-            point_values[idx] = mask_value * agent_value
-
-        indices = ~numpy.isnan(point_values)
-        masked = point_values[indices]
-
-        res = 0
-        if operation == 'average':
-            res = numpy.average(masked)
-        elif operation == 'sum':
-            res = numpy.sum(masked)
-        else:
-            raise NotImplementedError
-
-        if fail == True:
-            assert res != 0
-
-        tmp_prop.values()[idx] = res
+    if fail == True:
+        assert not numpy.isnan(result).any()
 
-    return tmp_prop
+    return Property('emptyfocal_agents', dest.uuid, dest.space_domain, dest.shapes, result)
 
 
 def where(condition, property1, property2):
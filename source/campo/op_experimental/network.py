@@ -1,112 +1,495 @@
-import copy
 import numpy
-import random
-import networkx as nx
 
-from ..values import Values
+from ..property import Property
+from ..points import Points
+from ..relation import Relation
+from ..utils import _color_message, _expand_ranges
+
+import campo.config as cc
+
+
+def _as_relation(neighbours):
+    """ Returns neighbours as Relation, dense adjacency properties are converted """
+
+    if isinstance(neighbours, Relation):
+        return neighbours
+    elif isinstance(neighbours, Property):
+        return Relation.from_dense(numpy.stack([neighbours.values()[idx] for idx in range(neighbours.nr_objects)]))
+    else:
+        msg = _color_message(f'Neighbours must be a Relation, not {type(neighbours).__name__}')
+        raise TypeError(msg)
+
+
+def _rng(seed):
+    """ Returns the Campo random generator, or a new one in case a seed is given """
+
+    return cc.rng if seed is None else numpy.random.default_rng(seed)
+
+
+def _edge_keys(sources, targets, nr_agents):
+    """ Returns a unique key per undirected edge """
+
+    return numpy.minimum(sources, targets) * nr_agents + numpy.maximum(sources, targets)
+
+
+def _sorted_unique(keys):
+    """ Returns the sorted unique keys """
+
+    keys = numpy.sort(keys)
+
+    return keys[numpy.concatenate(([True], keys[1:] != keys[:-1]))] if keys.size > 0 else keys
+
+
+def _insert_sorted(sorted_keys, keys):
+    """ Returns sorted_keys with keys not yet present inserted, keeping the order """
+
+    return numpy.insert(sorted_keys, numpy.searchsorted(sorted_keys, keys), keys)
+
+
+def _contains(sorted_keys, keys):
+    """ Returns whether each key occurs in sorted_keys """
+
+    positions = numpy.searchsorted(sorted_keys, keys)
+    found = positions < sorted_keys.size
+    found[found] = sorted_keys[positions[found]] == keys[found]
+
+    return found
+
+
+def _undirected_relation(nr_agents, sources, targets):
+    """ Returns a relation holding both directions of each edge """
+
+    return Relation.from_edges(nr_agents, numpy.concatenate((sources, targets)), numpy.concatenate((targets, sources)))
+
+
+def small_world_network(nr_agents, neighbours, probability, seed=None, max_rounds=100):
+    """ Returns a Watts-Strogatz small-world network
+
+    Each agent is connected to its neighbours nearest agents on a ring
+    lattice, after which each edge is rewired with the given probability
+    to a random agent. Rewiring is done in rounds over all selected edges,
+    candidates forming self-loops or duplicate edges are redrawn in the
+    next round. Edges not rewired after max_rounds keep their lattice
+    target.
+
+    :param nr_agents: number of agents
+    :type nr_agents: int
+    :param neighbours: number of lattice neighbours per agent, odd values are rounded down
+    :type neighbours: int
+    :param probability: rewiring probability per edge
+    :type probability: float
+    :param seed: seed for the random generator, uses the Campo generator if omitted
+    :type seed: int
+    :returns: undirected network
+    :rtype: Relation
+    """
+
+    if not 0 <= neighbours < nr_agents:
+        msg = _color_message(f'Number of neighbours must be in range [0, {nr_agents}), got {neighbours}')
+        raise ValueError(msg)
+
+    rng = _rng(seed)
+
+    half = neighbours // 2
+    sources = numpy.repeat(numpy.arange(nr_agents, dtype=numpy.int64), half)
+    targets = (sources + numpy.tile(numpy.arange(1, half + 1, dtype=numpy.int64), nr_agents)) % nr_agents
+
+    # Lattice edges remain reserved during rewiring
+    existing = _sorted_unique(_edge_keys(sources, targets, nr_agents))
+    pending = numpy.nonzero(rng.random(sources.size) < probability)[0]
+
+    for _ in range(max_rounds):
+        if pending.size == 0:
+            break
+
+        candidates = rng.integers(0, nr_agents, pending.size)
+        keys = _edge_keys(sources[pending], candidates, nr_agents)
+
+        valid = numpy.nonzero((candidates != sources[pending]) & ~_contains(existing, keys))[0]
+        keys, first = numpy.unique(keys[valid], return_index=True)
+        accepted = valid[first]
+
+        targets[pending[accepted]] = candidates[accepted]
+        existing = _insert_sorted(existing, keys)
+        pending = numpy.delete(pending, accepted)
+
+    return _undirected_relation(nr_agents, sources, targets)
+
+
+def random_network(nr_agents, probability, seed=None):
+    """ Returns an Erdős-Rényi random network
+
+    The number of edges is drawn from the binomial distribution over all
+    agent pairs, edges are drawn uniformly without replacement.
+
+    :param nr_agents: number of agents
+    :type nr_agents: int
+    :param probability: probability of an edge between two agents
+    :type probability: float
+    :param seed: seed for the random generator, uses the Campo generator if omitted
+    :type seed: int
+    :returns: undirected network
+    :rtype: Relation
+    """
+
+    if not 0 <= probability <= 1:
+        msg = _color_message(f'Probability must be in range [0, 1], got {probability}')
+        raise ValueError(msg)
+
+    rng = _rng(seed)
+
+    nr_pairs = nr_agents * (nr_agents - 1) // 2
+    nr_edges = rng.binomial(nr_pairs, probability) if nr_pairs > 0 else 0
+
+    keys = numpy.empty(0, dtype=numpy.int64)
+
+    while keys.size < nr_edges:
+        required = nr_edges - keys.size
+        sources = rng.integers(0, nr_agents, required)
+        targets = rng.integers(0, nr_agents, required)
+        distinct = sources != targets
+
+        candidates = _edge_keys(sources[distinct], targets[distinct], nr_agents)
+        candidates = candidates[~_contains(keys, candidates)]
+        candidates, first = numpy.unique(candidates, return_index=True)
+
+        # Keep the order of drawing to select the first required edges
+        candidates = candidates[numpy.argsort(first)][:required]
+        keys = _insert_sorted(keys, numpy.sort(candidates))
+
+    return _undirected_relation(nr_agents, keys // nr_agents, keys % nr_agents)
+
+
+def knn_network(pset, k, symmetric=False):
+    """ Returns a network connecting each agent to its k nearest agents
+
+    :param pset: point agents
+    :type pset: PropertySet
+    :param k: number of nearest agents
+    :type k: int
+    :param symmetric: also connect agents to the agents having them as nearest
+    :type symmetric: bool
+    :rtype: Relation
+    """
+
+    if not isinstance(pset.space_domain, Points):
+        msg = _color_message(f'Property set "{pset.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    domain = pset.space_domain
+    nr_agents = pset.nr_objects
+
+    indices, distances = domain.spatial_index().query_knn(domain.xcoord, domain.ycoord, k, exclude_self=True)
+
+    found = indices >= 0
+    sources = numpy.repeat(numpy.arange(nr_agents), found.sum(axis=1))
+    targets = indices[found]
+
+    if not symmetric:
+        return Relation.from_edges(nr_agents, sources, targets)
+
+    keys = _sorted_unique(_edge_keys(sources, targets, nr_agents))
+
+    return _undirected_relation(nr_agents, keys // nr_agents, keys % nr_agents)
+
+
+def network_from_graph(graph):
+    """ Returns a networkx graph as Relation, e.g. for graph types without
+    native generator. Agent indices follow the order of the graph nodes,
+    edge weights are taken from the 'weight' attribute.
+
+    :param graph: networkx graph
+    :type graph: networkx.Graph
+    :rtype: Relation
+    """
+
+    nodes = {node: idx for idx, node in enumerate(graph.nodes())}
+    edges = list(graph.edges(data='weight', default=1.0))
+
+    sources = numpy.array([nodes[edge[0]] for edge in edges], dtype=numpy.int64)
+    targets = numpy.array([nodes[edge[1]] for edge in edges], dtype=numpy.int64)
+    weights = numpy.array([edge[2] for edge in edges], dtype=numpy.float64)
+
+    if not graph.is_directed():
+        sources, targets = numpy.concatenate((sources, targets)), numpy.concatenate((targets, sources))
+        weights = numpy.concatenate((weights, weights))
+
+    return Relation.from_edges(len(nodes), sources, targets, weights)
 
 
 def neighbour_network(nodes, neighbours, probability, seed=None):
+    """ Returns a small-world network as sparse Relation, assign it to a
+    property set to attach it, e.g. pset.neighbours = neighbour_network(...)
+    """
+
+    return small_world_network(nodes, neighbours, probability, seed)
+
 
-    G = nx.watts_strogatz_graph(n=nodes, k=neighbours, p=probability, seed=seed)
+def _point_values(prop):
+    """ Returns the values of a point property with one value per agent as flat array """
 
-    a = nx.to_numpy_array(G, dtype=numpy.int8)
+    values, offsets = prop.values()._flatten()
 
-    # To avoid that location 0 always corresponds to node 0 we shuffle the nework
-    # this may lead to locations pointing at themselves?!
-    #numpy.random.shuffle(a)
+    if values.shape[0] != prop.nr_objects:
+        msg = _color_message(f'Property "{prop.name}" must hold one value per agent')
+        raise ValueError(msg)
 
-    return a
+    return values.astype(numpy.float64)
 
 
 def network_average_def(source_prop, value_prop, default):
+    """ Returns the average value of the neighbours of each agent, or the
+    default value for agents without neighbours
 
-    tmp_prop = copy.deepcopy(source_prop)
+    :param source_prop: neighbour network
+    :type source_prop: Relation
+    :param value_prop: point property with values to average
+    :type value_prop: Property
+    :param default: property holding the default value
+    :type default: Property
+    :rtype: Property
+    """
 
-    shapes = [()] * tmp_prop.nr_objects
+    relation = _as_relation(source_prop)
 
-    tmp_prop._values = Values(tmp_prop.nr_objects, shapes, numpy.nan)
+    values = _point_values(value_prop)
+    degree = relation.degree()
 
-    for idx, i in enumerate(tmp_prop.values()):
-        neighbour_ids = numpy.nonzero(source_prop.values()[idx]>0)
-        val = 0.0
-        if len(neighbour_ids[0]) == 0:
-            tmp_prop.values()[idx] = default.values()[0]
-        else:
-            for n in neighbour_ids[0]:
-                nval = value_prop.values()[n]
-                val += nval
-            tmp_prop.values()[idx] = val / len(neighbour_ids[0])
+    result = numpy.full(relation.nr_objects, numpy.squeeze(default.values()[0]), dtype=numpy.float64)
+    connected = degree > 0
+    result[connected] = relation.dot(values, weighted=False)[connected] / degree[connected]
 
-    return tmp_prop
+    return Property(value_prop.name, value_prop.pset_uuid, value_prop.space_domain, value_prop.shapes, result)
 
 
 def network_average(source_prop, value_prop, fname):
+    """ Returns the average value of the neighbours of each agent, NaN for
+    agents without neighbours
+
+    :param source_prop: neighbour network
+    :type source_prop: Relation
+    :param value_prop: point property with values to average
+    :type value_prop: Property
+    :rtype: Property
+    """
+
+    relation = _as_relation(source_prop)
+
+    values = _point_values(value_prop)
+    degree = relation.degree()
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        result = relation.dot(values, weighted=False) / degree
+
+    return Property(value_prop.name, value_prop.pset_uuid, value_prop.space_domain, value_prop.shapes, result)
+
+
+def _neighbour_mean(relation, values, strength):
+    """ Returns the weighted mean of the neighbour values, agents without
+    neighbours keep their own value
+    """
+
+    result = values.copy()
+    connected = strength > 0
+    result[connected] = relation.dot(values)[connected] / strength[connected]
+
+    return result
+
+
+def network_diffusion(neighbours, value_prop, steps=1, rate=1.0, tolerance=None):
+    """ Returns values diffused over the network
+
+    Each step every agent moves its value towards the weighted mean of its
+    neighbours' values, x = (1 - rate) * x + rate * mean(neighbours).
+    Agents without neighbours keep their value.
+
+    :param neighbours: neighbour network
+    :type neighbours: Relation
+    :param value_prop: point property with initial values
+    :type value_prop: Property
+    :param steps: maximum number of diffusion steps
+    :type steps: int
+    :param rate: fraction of the neighbour mean taken over per step, in range [0, 1]
+    :type rate: float
+    :param tolerance: stop when no value changes by more than tolerance
+    :type tolerance: float
+    :rtype: Property
+    """
+
+    if not 0 <= rate <= 1:
+        msg = _color_message(f'Rate must be in range [0, 1], got {rate}')
+        raise ValueError(msg)
+
+    relation = _as_relation(neighbours)
+
+    values = _point_values(value_prop)
+    strength = relation.dot(numpy.ones(relation.nr_targets))
+
+    for _ in range(steps):
+        previous = values
+        values = (1.0 - rate) * values + rate * _neighbour_mean(relation, values, strength)
+
+        if tolerance is not None and numpy.nanmax(numpy.abs(values - previous), initial=0.0) <= tolerance:
+            break
+
+    return Property(value_prop.name, value_prop.pset_uuid, value_prop.space_domain, value_prop.shapes, values)
+
+
+def network_pagerank(neighbours, value_prop, damping=0.85, tolerance=1e-8, max_iterations=100):
+    """ Returns values propagated over the network in personalised PageRank style
 
-    tmp_prop = copy.deepcopy(value_prop)
+    Iterates x = (1 - damping) * v + damping * mean(neighbours of x), with v
+    the initial values, until no value changes by more than tolerance.
+    Agents without neighbours keep their initial value.
 
-    for idx, i in enumerate(tmp_prop.values()):
-        neighbour_ids = numpy.nonzero(source_prop.values()[idx]>0)
-        val = 0.0
-        for n in neighbour_ids[0]:
-            #nval = value_prop.values.values[n]
-            nval = value_prop.values()[n]
-            val += nval
-        tmp_prop.values()[idx] = val / len(neighbour_ids[0])
+    :param neighbours: neighbour network
+    :type neighbours: Relation
+    :param value_prop: point property with initial values
+    :type value_prop: Property
+    :param damping: weight of the neighbour values, in range [0, 1)
+    :type damping: float
+    :param tolerance: convergence tolerance
+    :type tolerance: float
+    :param max_iterations: maximum number of iterations
+    :type max_iterations: int
+    :rtype: Property
+    """
 
-    return tmp_prop
+    if not 0 <= damping < 1:
+        msg = _color_message(f'Damping must be in range [0, 1), got {damping}')
+        raise ValueError(msg)
+
+    relation = _as_relation(neighbours)
+
+    initial = _point_values(value_prop)
+    strength = relation.dot(numpy.ones(relation.nr_targets))
+
+    values = initial
+    for _ in range(max_iterations):
+        previous = values
+        values = (1.0 - damping) * initial + damping * _neighbour_mean(relation, values, strength)
+
+        if numpy.nanmax(numpy.abs(values - previous), initial=0.0) <= tolerance:
+            break
+
+    return Property(value_prop.name, value_prop.pset_uuid, value_prop.space_domain, value_prop.shapes, values)
+
+
+def network_sum(neighbours, value_prop, normalisation=None):
+    """ Returns the weighted sum of the neighbour values of each agent
+
+    :param neighbours: neighbour network
+    :type neighbours: Relation
+    :param value_prop: point property with values to sum
+    :type value_prop: Property
+    :param normalisation: None for plain sums, 'source' to divide by the degree
+                          of the agent, 'target' to divide each neighbour value
+                          by the in-degree of the neighbour, or 'symmetric' to
+                          divide by the square root of both degrees
+    :type normalisation: str
+    :rtype: Property
+    """
+
+    normalisations = (None, 'source', 'target', 'symmetric')
+    if normalisation not in normalisations:
+        msg = _color_message(f'Normalisation "{normalisation}" is not one of {normalisations}')
+        raise ValueError(msg)
+
+    relation = _as_relation(neighbours)
+
+    values = _point_values(value_prop)
+    degree = relation.degree().astype(numpy.float64)
+
+    # Number of incoming edges per neighbour, differs from the degree in directed networks
+    target_degree = numpy.bincount(relation.indices, minlength=relation.nr_targets).astype(numpy.float64)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if normalisation is None or normalisation == 'source':
+            result = relation.dot(values)
+        elif normalisation == 'target':
+            result = relation.dot(numpy.where(target_degree > 0, values / target_degree, 0.0))
+        else:
+            result = relation.dot(numpy.where(target_degree > 0, values / numpy.sqrt(target_degree), 0.0))
+
+        if normalisation == 'source':
+            result = numpy.where(degree > 0, result / degree, 0.0)
+        elif normalisation == 'symmetric':
+            result = numpy.where(degree > 0, result / numpy.sqrt(degree), 0.0)
+
+    return Property(value_prop.name, value_prop.pset_uuid, value_prop.space_domain, value_prop.shapes, result)
 
 
 def spread_neighbours(neighbours, threshold, random_seed, breeds, mask, albedos, ages, seed=None):
+    """ Seeds free neighbours of active agents
+
+    Active agents (mask value 1) with a random seed value below their
+    threshold each occupy one randomly chosen free neighbour (mask value
+    -1), taking over their breed and albedo. Seeding is done in rounds:
+    when several agents choose the same neighbour the agent with the
+    lowest index wins, the others choose again among their remaining free
+    neighbours in the next round.
+
+    :param neighbours: neighbour network
+    :type neighbours: Relation
+    :param seed: seed for the random generator, uses the Campo generator if omitted
+    :type seed: int
+    """
+
+    rng = _rng(seed)
 
-    if seed:
-        random.seed(seed)
+    relation = _as_relation(neighbours)
+    degree = relation.degree()
 
-    nr_agents = len(mask.values().values)
     shape = threshold.values().values[0].shape
     thresh = threshold.values().values[0].reshape(shape[0] * shape[1])
-    mask_val = numpy.zeros(len(mask.values().values))
-    new_mask = numpy.zeros(len(mask.values().values))
-
-    for idx, it in enumerate(mask.values()):
-        mask_val[idx] = it
-        new_mask[idx] = it
-    rseed = random_seed.values().values
-    breed = breeds.values().values
-    albedo = albedos.values().values
-    age = ages.values().values
-
-    for agent_id, neigh in enumerate(neighbours.values()):
-        is_active =  mask_val[agent_id] == 1
-
-        # only actives of the current timestep do something
-        if is_active:
-            agent_breed = int(breed[agent_id])
-            agent_albedo = albedo[agent_id]
-            tr = thresh[agent_id]
-            seed_value = rseed[agent_id][0]
-            wneigh = neigh.copy()
-            wneigh[agent_id] = 0
-
-            if seed_value < tr:
-                empty = []
-                # determine free neighbours, also exclude the newly seeded
-                for nidx in range(0, nr_agents):
-                    if wneigh[nidx] == 1 and new_mask[nidx] == -1:
-                        empty.append(nidx)
-
-                # select one free one...
-                if len(empty) > 0:
-                    select = random.choice(empty)
-
-                    # update mask
-                    new_mask[select] = 1
-                    # and others
-                    breed[select] = numpy.array([float(agent_breed)])
-                    albedo[select] = agent_albedo
-                    age[select] = numpy.array([1])
-
-    # update mask with new alives
-    for idx, v in enumerate(mask.values()):
-        mask.values()[idx] = numpy.array([new_mask[idx]])
 
+    mask_val, offsets = mask.values()._flatten()
+    new_mask = mask_val.astype(numpy.float64)
+    rseed, offsets = random_seed.values()._flatten()
+
+    breed, offsets = breeds.values()._flatten()
+    albedo, offsets = albedos.values()._flatten()
+    age, offsets = ages.values()._flatten()
+
+    # Only actives of the current timestep do something
+    pending = numpy.nonzero((mask_val == 1) & (rseed < thresh[:len(mask_val)]))[0]
+
+    while pending.size > 0:
+        owner, positions = _expand_ranges(relation.indptr[pending], degree[pending])
+        targets = relation.indices[positions]
+
+        # Free neighbours, also excluding the newly seeded
+        free = (new_mask[targets] == -1) & (targets != pending[owner])
+        owner = owner[free]
+        targets = targets[free]
+
+        nr_free = numpy.bincount(owner, minlength=pending.size)
+        searching = nr_free > 0
+        if not numpy.any(searching):
+            break
+
+        # Select one free neighbour per searching agent
+        free_start = numpy.cumsum(nr_free) - nr_free
+        choice = (rng.random(pending.size) * nr_free).astype(numpy.int64)
+        agents = pending[searching]
+        selected = targets[(free_start + choice)[searching]]
+
+        # Resolve conflicts, lowest agent index wins
+        order = numpy.lexsort((agents, selected))
+        selected, first = numpy.unique(selected[order], return_index=True)
+        winners = agents[order][first]
+
+        new_mask[selected] = 1
+        breed[selected] = numpy.trunc(breed[winners])
+        albedo[selected] = albedo[winners]
+        age[selected] = 1
+
+        won = numpy.zeros(pending.size, dtype=bool)
+        won[numpy.searchsorted(pending, winners)] = True
+        pending = pending[searching & ~won]
+
+    # Update mask with new alives
+    mask.set_values(new_mask)
+    breeds.set_values(breed)
+    albedos.set_values(albedo)
+    ages.set_values(age)
@@ -0,0 +1,93 @@
+from ..property import Property
+from ..points import Points
+from ..relation import Relation
+from ..utils import _color_message
+from .network import knn_network
+
+
+def nearest(source_pset, target_pset, k=1):
+    """ Returns for each source agent the k nearest agents of the target property set
+
+    Agents are searched with the spatial index of the target locations,
+    for mobile agents the index follows their current coordinates.
+    In case source and target are the same property set an agent is not
+    considered as its own neighbour.
+
+    :param source_pset: point agents to search from
+    :type source_pset: PropertySet
+    :param target_pset: point agents to search for
+    :type target_pset: PropertySet
+    :param k: number of nearest agents
+    :type k: int
+    :returns: a property with the indices and a property with the distances
+              of the k nearest target agents, ordered by distance. Missing
+              neighbours are indicated by -1 and NaN
+    :rtype: tuple of Property
+    """
+
+    if not isinstance(source_pset.space_domain, Points):
+        msg = _color_message(f'Property set "{source_pset.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    if not isinstance(target_pset.space_domain, Points):
+        msg = _color_message(f'Property set "{target_pset.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    if k < 1:
+        msg = _color_message(f'Number of nearest agents must be positive, got {k}')
+        raise ValueError(msg)
+
+    source = source_pset.space_domain
+    index = target_pset.space_domain.spatial_index()
+
+    exclude_self = source_pset.uuid == target_pset.uuid
+
+    indices, distances = index.query_knn(source.xcoord, source.ycoord, k, exclude_self=exclude_self)
+
+    shapes = [(k,)] * source_pset.nr_objects
+
+    indices_prop = Property('emptynearestindices', source_pset.uuid, source, shapes, indices)
+    distances_prop = Property('emptynearestdistances', source_pset.uuid, source, shapes, distances)
+
+    return indices_prop, distances_prop
+
+
+def proximity_network(pset, radius=None, k=None):
+    """ Returns a network connecting agents by spatial proximity
+
+    Either all agents within a search radius are connected, or each agent
+    is connected to its k nearest agents. Agents are not connected to
+    themselves. The resulting relation can be assigned to the property
+    set and used by the network operators.
+
+    :param pset: point agents
+    :type pset: PropertySet
+    :param radius: search distance, one for all agents or a Property with one value per agent
+    :type radius: float or Property
+    :param k: number of nearest agents
+    :type k: int
+    :rtype: Relation
+    """
+
+    if not isinstance(pset.space_domain, Points):
+        msg = _color_message(f'Property set "{pset.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    if (radius is None) == (k is None):
+        msg = _color_message('Provide either a radius or a number of nearest agents')
+        raise ValueError(msg)
+
+    if k is not None:
+        if k < 1:
+            msg = _color_message(f'Number of nearest agents must be positive, got {k}')
+            raise ValueError(msg)
+
+        return knn_network(pset, k)
+
+    if isinstance(radius, Property):
+        radius = radius.values()._flatten()[0]
+
+    domain = pset.space_domain
+    indptr, indices, _ = domain.spatial_index().query_radius(domain.xcoord, domain.ycoord, radius, exclude_self=True)
+
+    return Relation(pset.nr_objects, indptr, indices)
@@ -1,107 +1,88 @@
-from osgeo import gdal
-from osgeo import osr
-from osgeo import ogr
-
-gdal.UseExceptions()
-
-import math
 import numpy as np
 
 from ..property import Property
+from ..points import Points
+from ..areas import Areas
+from ..utils import _color_message
 
 
-def feature_to_raster(field_pset, point_pset):
+_reductions = ('count', 'sum', 'mean', 'min', 'max', 'last')
 
-    spatial_ref = osr.SpatialReference()
-    spatial_ref.ImportFromEPSG(28992)
 
-    ogr_source=ogr.GetDriverByName('MEMORY').CreateDataSource('memSource')
+def _cell_offsets(index):
+    """ Returns the offset of each field agent in a flat buffer of all cells """
 
-    tmp_prop = Property('emptycreatename', field_pset.uuid, field_pset.space_domain, field_pset.shapes)
+    offsets = np.zeros(index.nr_items + 1, dtype=np.int64)
+    np.cumsum(index.nr_rows * index.nr_cols, out=offsets[1:])
 
-    for idx, area in enumerate(field_pset.space_domain):
-        # Point feature for current location
-        point_x = point_pset.space_domain.xcoord[idx]
-        point_y = point_pset.space_domain.ycoord[idx]
+    return offsets
 
-        layername = 'locations'
-        if ogr_source.GetLayerByName(layername):
-            ogr_source.DeleteLayer(layername)
 
-        lyr = ogr_source.CreateLayer(layername, geom_type=ogr.wkbPoint, srs=spatial_ref)
+def _split(field_pset, index, raster, offsets):
+    """ Returns a property with the rasters of the field agents taken from a flat buffer """
 
-        feat = ogr.Feature(lyr.GetLayerDefn())
-        point = ogr.Geometry(ogr.wkbPoint)
-        point.AddPoint(point_x, point_y)
-        feat.SetGeometry(point)
+    tmp_prop = Property('emptycreatename', field_pset.uuid, field_pset.space_domain, field_pset.shapes)
 
-        lyr.CreateFeature(feat)
+    for idx in range(index.nr_items):
+        tmp_prop.values()[idx] = raster[offsets[idx]:offsets[idx + 1]].reshape(index.nr_rows[idx], index.nr_cols[idx])
 
-        # Raster
-        nr_rows = int(area[4])
-        nr_cols = int(area[5])
-        cellsize = cellsize = math.fabs(area[2] - area[0]) / nr_cols
+    return tmp_prop
 
-        minX = area[0]
-        maxY = area[3]
 
-        target_ds = gdal.GetDriverByName('MEM').Create('', nr_cols, nr_rows, 1, gdal.GDT_Byte)
-        target_ds.SetGeoTransform((minX, cellsize, 0, maxY, 0, -cellsize))
-        target_ds.SetProjection(spatial_ref.ExportToWkt())
+def _burn(field_pset, agents, rows, cols):
+    """ Returns a property with value 1 in the given cells of the field agents, 0 elsewhere """
 
-        gdal.PushErrorHandler('CPLQuietErrorHandler')
-        err = gdal.RasterizeLayer(target_ds, [1], lyr, burn_values=[1], options=['ALL_TOUCHED=TRUE'])
-        gdal.PopErrorHandler()
+    index = field_pset.space_domain.extent_index()
+    offsets = _cell_offsets(index)
 
-        band = target_ds.GetRasterBand(1)
-        array = band.ReadAsArray()
+    raster = np.zeros(offsets[-1], dtype=np.uint8)
+    raster[offsets[agents] + rows * index.nr_cols[agents] + cols] = 1
 
-        tmp_prop.values()[idx] = array
+    return _split(field_pset, index, raster, offsets)
 
-    return tmp_prop
 
+def feature_to_raster(field_pset, point_pset):
+    """ Returns for each field agent a raster with value 1 in the cell
+    containing the point agent of the same index, 0 elsewhere
 
-def feature_to_raster_all(field_pset, point_pset):
+    As with GDAL rasterisation, points on the border of a cell are assigned
+    to the cell to the right or below, points on the eastern or southern
+    border of a field agent are outside of its raster.
+    """
 
-    spatial_ref = osr.SpatialReference()
-    spatial_ref.ImportFromEPSG(28992)
+    index = field_pset.space_domain.extent_index()
 
-    outdriver=ogr.GetDriverByName('MEMORY')
-    source=outdriver.CreateDataSource('memData')
-    tmp=outdriver.Open('memData', 1)
-    lyr = source.CreateLayer('locations', geom_type=ogr.wkbPoint, srs=spatial_ref)
+    agents = np.arange(field_pset.nr_objects)
+    x = np.asarray(point_pset.space_domain.xcoord[agents], dtype=np.float64)
+    y = np.asarray(point_pset.space_domain.ycoord[agents], dtype=np.float64)
 
-    for coordinate in point_pset.space_domain:
-        feat = ogr.Feature(lyr.GetLayerDefn())
-        feat.SetGeometry(ogr.CreateGeometryFromWkt('POINT({} {})'.format(float(coordinate[0]), float(coordinate[1]))))
+    inside = (x >= index.xmin) & (x < index.xmax) & (y > index.ymin) & (y <= index.ymax)
+    agents = agents[inside]
 
-        lyr.CreateFeature(feat)
+    rows, cols = index.cell_indices(agents, x[inside], y[inside])
 
-    tmp_prop = Property('emptycreatename', field_pset.uuid, field_pset.space_domain, field_pset.shapes)
+    return _burn(field_pset, agents, rows, cols)
 
-    for idx, area in enumerate(field_pset.space_domain):
 
-        nr_rows = int(area[4])
-        nr_cols = int(area[5])
-        cellsize = cellsize = math.fabs(area[2] - area[0]) / nr_cols
+def feature_to_raster_all(field_pset, point_pset):
+    """ Returns for each field agent a raster with value 1 in the cells
+    containing any point agent, 0 elsewhere
 
-        minX = area[0]
-        maxY = area[3]
+    As with GDAL rasterisation, points on the border of a cell are assigned
+    to the cell to the right or below, points on the eastern or southern
+    border of a field agent are outside of its raster.
+    """
 
-        target_ds = gdal.GetDriverByName('MEM').Create('', nr_cols, nr_rows, 1, gdal.GDT_Byte)
-        target_ds.SetGeoTransform((minX, cellsize, 0, maxY, 0, -cellsize))
-        target_ds.SetProjection(spatial_ref.ExportToWkt())
+    domain = point_pset.space_domain
+    index = field_pset.space_domain.extent_index()
 
-        gdal.PushErrorHandler('CPLQuietErrorHandler')
-        err = gdal.RasterizeLayer(target_ds, [1], lyr, burn_values=[1], options=['ALL_TOUCHED=TRUE'])
-        gdal.PopErrorHandler()
+    points, agents, rows, cols = index.query(domain.xcoord, domain.ycoord)
 
-        band = target_ds.GetRasterBand(1)
-        array = band.ReadAsArray()
+    x = np.asarray(domain.xcoord, dtype=np.float64)[points]
+    y = np.asarray(domain.ycoord, dtype=np.float64)[points]
+    inside = (x < index.xmax[agents]) & (y > index.ymin[agents])
 
-        tmp_prop.values()[idx] = array
-
-    return tmp_prop
+    return _burn(field_pset, agents[inside], rows[inside], cols[inside])
 
 
 def feature_values_to_raster(field_pset, point_pset, point_prop):
@@ -124,3 +105,78 @@ def feature_values_to_raster(field_pset, point_pset, point_prop):
 
 
 
+
+
+def points_to_raster(field_pset, point_pset, point_prop=None, reduction='count'):
+    """ Returns for each field agent a raster of the point agents located in its cells
+
+    Points located in overlapping field agents contribute to each of them.
+
+    :param field_pset: field agents
+    :type field_pset: PropertySet
+    :param point_pset: point agents
+    :type point_pset: PropertySet
+    :param point_prop: point values to aggregate, not required for 'count'
+    :type point_prop: Property
+    :param reduction: 'count', 'sum', 'mean', 'min', 'max', or 'last' for the
+                      value of the point agent with the highest index
+    :type reduction: str
+    :returns: a property with the aggregated values, 0 for cells without
+              points in case of count and sum, NaN otherwise
+    :rtype: Property
+    """
+
+    if not isinstance(field_pset.space_domain, Areas):
+        msg = _color_message(f'Property set "{field_pset.name}" must be of domain type Area')
+        raise TypeError(msg)
+
+    if not isinstance(point_pset.space_domain, Points):
+        msg = _color_message(f'Property set "{point_pset.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    if reduction not in _reductions:
+        msg = _color_message(f'Reduction "{reduction}" is not one of {", ".join(_reductions)}')
+        raise ValueError(msg)
+
+    if reduction != 'count':
+        if not isinstance(point_prop, Property) or point_prop.pset_uuid != point_pset.uuid:
+            msg = _color_message(f'Reduction "{reduction}" requires a property of property set "{point_pset.name}"')
+            raise TypeError(msg)
+
+    domain = point_pset.space_domain
+    index = field_pset.space_domain.extent_index()
+    offsets = _cell_offsets(index)
+
+    points, agents, rows, cols = index.query(domain.xcoord, domain.ycoord)
+    cells = offsets[agents] + rows * index.nr_cols[agents] + cols
+    nr_cells = offsets[-1]
+
+    if reduction == 'count':
+        return _split(field_pset, index, np.bincount(cells, minlength=nr_cells).astype(np.float64), offsets)
+
+    values, value_offsets = point_prop.values()._flatten()
+    if values.shape[0] != point_pset.nr_objects:
+        msg = _color_message(f'Property "{point_prop.name}" must hold one value per agent')
+        raise ValueError(msg)
+
+    values = values.astype(np.float64)[points]
+
+    if reduction in ('sum', 'mean'):
+        raster = np.bincount(cells, weights=values, minlength=nr_cells)
+
+        if reduction == 'mean':
+            counts = np.bincount(cells, minlength=nr_cells)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                raster = np.where(counts > 0, raster / counts, np.nan)
+    elif reduction in ('min', 'max'):
+        ufunc = np.minimum if reduction == 'min' else np.maximum
+        raster = np.full(nr_cells, np.inf if reduction == 'min' else -np.inf)
+        ufunc.at(raster, cells, values)
+        raster[np.isinf(raster) & (np.bincount(cells, minlength=nr_cells) == 0)] = np.nan
+    else:
+        # Locations are ordered by point, keep the last point per cell
+        raster = np.full(nr_cells, np.nan)
+        unique_cells, last = np.unique(cells[::-1], return_index=True)
+        raster[unique_cells] = values[::-1][last]
+
+    return _split(field_pset, index, raster, offsets)
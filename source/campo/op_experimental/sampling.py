@@ -0,0 +1,56 @@
+import numpy
+
+from ..property import Property
+from ..points import Points
+from ..areas import Areas
+from ..utils import _color_message
+
+
+def sample(field_prop, point_pset):
+    """ Returns for each point agent the field value at its location
+
+    The field agents containing the points and the cells are obtained from
+    the extent index of the field domain. In case field agents overlap
+    the value of the field agent with the lowest index is taken.
+
+    :param field_prop: field values to sample
+    :type field_prop: Property
+    :param point_pset: point agents sampling the field
+    :type point_pset: PropertySet
+    :returns: a property with the sampled values, NaN for points outside
+              all field agents
+    :rtype: Property
+    """
+
+    if not isinstance(field_prop, Property):
+        msg = _color_message('field_prop must be of type Property')
+        raise TypeError(msg)
+
+    if not isinstance(field_prop.space_domain, Areas):
+        msg = _color_message(f'Property "{field_prop.name}" must be of domain type Area')
+        raise TypeError(msg)
+
+    if not isinstance(point_pset.space_domain, Points):
+        msg = _color_message(f'Property set "{point_pset.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    domain = point_pset.space_domain
+    index = field_prop.space_domain.extent_index()
+
+    points, agents, rows, cols = index.query(domain.xcoord, domain.ycoord)
+
+    # Locations are ordered by point and field agent, keep the first field agent
+    first = numpy.ones(len(points), dtype=bool)
+    first[1:] = points[1:] != points[:-1]
+    points = points[first]
+    agents = agents[first]
+    rows = rows[first]
+    cols = cols[first]
+
+    result = numpy.full(point_pset.nr_objects, numpy.nan)
+
+    # Gather the cells of all field agents at once from the flattened values
+    field_values, field_offsets = field_prop.values()._flatten()
+    result[points] = field_values[field_offsets[agents] + rows * index.nr_cols[agents] + cols]
+
+    return Property('emptysamplename', point_pset.uuid, domain, point_pset.shapes, result)
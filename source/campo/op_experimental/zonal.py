@@ -0,0 +1,171 @@
+import warnings
+import numpy
+
+from ..property import Property
+from ..points import Points
+from ..areas import Areas
+from ..utils import _color_message
+
+
+_statistics = ('sum', 'mean', 'min', 'max', 'count', 'std', 'percentile')
+
+
+def _reduce_same_shape(values, statistic, percentile):
+    """ Reduces values of shape (agents, cells) along the cells axis """
+
+    with warnings.catch_warnings():
+        # Agents without valid cells result in NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        if statistic == 'sum':
+            return numpy.nansum(values, axis=1)
+        elif statistic == 'mean':
+            return numpy.nanmean(values, axis=1)
+        elif statistic == 'min':
+            return numpy.nanmin(values, axis=1)
+        elif statistic == 'max':
+            return numpy.nanmax(values, axis=1)
+        elif statistic == 'count':
+            return numpy.count_nonzero(~numpy.isnan(values), axis=1).astype(numpy.float64)
+        elif statistic == 'std':
+            return numpy.nanstd(values, axis=1)
+        elif statistic == 'percentile':
+            return numpy.nanpercentile(values, percentile, axis=1)
+
+    raise NotImplementedError
+
+
+def _reduce_segments(values, offsets, statistic, percentile):
+    """ Reduces consecutive segments of a flat array, agent i holds
+    values[offsets[i]:offsets[i + 1]]
+    """
+
+    nr_agents = len(offsets) - 1
+    sizes = numpy.diff(offsets)
+    segments = numpy.repeat(numpy.arange(nr_agents), sizes)
+
+    valid = ~numpy.isnan(values)
+    counts = numpy.bincount(segments, weights=valid, minlength=nr_agents)
+    located = counts > 0
+
+    result = numpy.full(nr_agents, numpy.nan)
+
+    if statistic == 'count':
+        return counts
+
+    if statistic in ('sum', 'mean', 'std'):
+        sums = numpy.bincount(segments, weights=numpy.where(valid, values, 0.0), minlength=nr_agents)
+
+        if statistic == 'sum':
+            return sums
+
+        result[located] = sums[located] / counts[located]
+
+        if statistic == 'std':
+            deviations = numpy.where(valid, values - result[segments], 0.0)
+            squares = numpy.bincount(segments, weights=deviations**2, minlength=nr_agents)
+            result[located] = numpy.sqrt(squares[located] / counts[located])
+
+        return result
+
+    if statistic in ('min', 'max'):
+        nonempty = sizes > 0
+        if statistic == 'min':
+            extremes = numpy.minimum.reduceat(numpy.where(valid, values, numpy.inf), offsets[:-1][nonempty])
+        else:
+            extremes = numpy.maximum.reduceat(numpy.where(valid, values, -numpy.inf), offsets[:-1][nonempty])
+
+        result[nonempty] = extremes
+        result[~located] = numpy.nan
+
+        return result
+
+    if statistic == 'percentile':
+        # Sort within each agent, missing values last
+        keys = numpy.where(valid, values, numpy.inf)
+        keys = keys[numpy.lexsort((keys, segments))]
+
+        position = percentile / 100.0 * (counts[located] - 1)
+        lower = numpy.floor(position).astype(numpy.int64)
+        upper = numpy.ceil(position).astype(numpy.int64)
+        start = offsets[:-1][located]
+
+        low_values = keys[start + lower]
+        high_values = keys[start + upper]
+        result[located] = low_values + (high_values - low_values) * (position - lower)
+
+        return result
+
+    raise NotImplementedError
+
+
+def zonal(dest, field_prop, statistic='mean', mask=None, percentile=None):
+    """ Returns for each field agent a statistic of its cell values
+
+    Field agents of the same shape are reduced along the cell axes of
+    their stacked values, field agents of different shapes as segments of
+    one flat array. NaN cells are ignored.
+
+    :param dest: point property set (determines property return type)
+    :type dest: PropertySet
+    :param field_prop: field values to reduce
+    :type field_prop: Property
+    :param statistic: one of 'sum', 'mean', 'min', 'max', 'count', 'std' or 'percentile'
+    :type statistic: str
+    :param mask: field property, only cells with a non-zero mask value are taken into account
+    :type mask: Property
+    :param percentile: percentile in range [0, 100], required for statistic 'percentile'
+    :type percentile: float
+    :returns: a property with one value per agent, NaN for agents without
+              valid cells (0 for sum and count)
+    :rtype: Property
+    """
+
+    if not isinstance(dest.space_domain, Points):
+        msg = _color_message(f'Property set "{dest.name}" must be of domain type Point')
+        raise TypeError(msg)
+
+    if not isinstance(field_prop, Property) or not isinstance(field_prop.space_domain, Areas):
+        msg = _color_message('field_prop must be a Property of domain type Area')
+        raise TypeError(msg)
+
+    if mask is not None:
+        if not isinstance(mask, Property) or mask.pset_uuid != field_prop.pset_uuid:
+            msg = _color_message(f'Mask must be a Property of the same PropertySet as "{field_prop.name}"')
+            raise TypeError(msg)
+
+    if statistic not in _statistics:
+        msg = _color_message(f'Statistic "{statistic}" is not one of {", ".join(_statistics)}')
+        raise ValueError(msg)
+
+    if statistic == 'percentile' and (percentile is None or not 0 <= percentile <= 100):
+        msg = _color_message('Statistic "percentile" requires a percentile in range [0, 100]')
+        raise ValueError(msg)
+
+    if dest.nr_objects != field_prop.nr_objects:
+        msg = _color_message(f'Number of point agents ({dest.nr_objects}) does not match number of field agents ({field_prop.nr_objects})')
+        raise ValueError(msg)
+
+    nr_agents = field_prop.nr_objects
+    shapes = set(tuple(shape) for shape in field_prop.shapes)
+
+    if len(shapes) == 1:
+        values = numpy.stack([field_prop.values()[idx] for idx in range(nr_agents)]).astype(numpy.float64)
+        values = values.reshape(nr_agents, -1)
+
+        if mask is not None:
+            mask_values = numpy.stack([mask.values()[idx] for idx in range(nr_agents)]).reshape(nr_agents, -1)
+            values[(mask_values == 0) | numpy.isnan(mask_values)] = numpy.nan
+
+        result = _reduce_same_shape(values, statistic, percentile)
+    else:
+        values, offsets = field_prop.values()._flatten()
+        values = values.astype(numpy.float64)
+
+        if mask is not None:
+            mask_values, mask_offsets = mask.values()._flatten()
+            values[(mask_values == 0) | numpy.isnan(mask_values)] = numpy.nan
+
+        result = _reduce_segments(values, offsets, statistic, percentile)
+
+    return Property('emptyzonalname', dest.uuid, dest.space_domain, dest.shapes, result)
@@ -183,7 +183,7 @@ def spread(start_locations, frictiondist, friction):
         results = ex.map(_pspread, todo, chunksize=chunks)
 
     for result in results:
-        result_prop.values().values[result[0]] = result[1]
+        result_prop.values()[result[0]] = result[1]
 
     return result_prop
 
@@ -201,7 +201,7 @@ def spread(start_locations, frictiondist, friction):
 
         result_raster = pcraster.spread(arg1_raster, frictiondist_raster, friction_raster)
         result_item = pcraster.pcr2numpy(result_raster, numpy.nan)
-        result_prop.values().values[idx] = result_item
+        result_prop.values()[idx] = result_item
 
     return result_prop
 
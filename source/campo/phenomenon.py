@@ -35,6 +35,10 @@ class Phenomenon(object):
 
     def __getattr__(self, property_set_name):
 
+        # Attributes looked up before initialisation, e.g. when unpickling
+        if property_set_name.startswith('_'):
+            raise AttributeError(property_set_name)
+
         if property_set_name in self._property_sets:
             return self._property_sets[property_set_name]
         else:
@@ -1,10 +1,18 @@
 import csv
 import numpy as np
 
+from .spatialindex import GridIndex
+
 
 class Points():
     def __init__(self, mobile=False):
 
+        # Incremented on each coordinate assignment
+        self._version = 0
+
+        self._spatial_index = None
+        self._spatial_index_version = None
+
         self.nr_items = None
 
         self.space_dimension_constant = None
@@ -51,6 +59,7 @@ class Points():
                 raise RuntimeError(msg)
 
         self._xcoord = new_values
+        self._version += 1
 
     @property
     def ycoord(self):
@@ -68,6 +77,7 @@ class Points():
                 raise RuntimeError(msg)
 
         self._ycoord = new_values
+        self._version += 1
 
     @property
     def nr_items(self):
@@ -115,6 +125,32 @@ class Points():
     def __repr__(self):
         return 'Point'
 
+    def __getstate__(self):
+        # The index is rebuilt on demand, avoid copying it with the domain
+        state = self.__dict__.copy()
+        state['_spatial_index'] = None
+        state['_spatial_index_version'] = None
+        return state
+
+    def spatial_index(self):
+        """ Returns a grid index on the current point locations
+
+        The index is created on first use and follows subsequent assignments
+        to xcoord and ycoord, e.g. of mobile agents. Only agents that moved
+        out of their grid cell are re-indexed.
+
+        :returns: index for neighbourhood queries
+        :rtype: GridIndex
+        """
+        if self._spatial_index is None:
+            self._spatial_index = GridIndex(self.xcoord, self.ycoord)
+        elif self._spatial_index_version != self._version:
+            self._spatial_index.update(self.xcoord, self.ycoord)
+
+        self._spatial_index_version = self._version
+
+        return self._spatial_index
+
     def _get_coordinates(self):
 
         self._coordinates[:, 0] = self.xcoord
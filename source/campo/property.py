@@ -1,6 +1,8 @@
 import numpy as np
 
 from .values import Values
+from .utils import _color_message
+from .storage import _check_tools
 
 
 class Property(object):
@@ -17,6 +19,12 @@ class Property(object):
 
         self._values = Values(self._nr_agents, self._shape, initial_value)
 
+        # HDF5 storage options in the output dataset, see StorageOptions
+        self._storage = None
+
+        # Output schedule of dynamic values, None for each timestep
+        self._output = None
+
     @property
     def is_dynamic(self):
         return self._is_dynamic
@@ -25,6 +33,67 @@ class Property(object):
     def is_dynamic(self, value):
         self._is_dynamic = value
 
+    @property
+    def storage(self):
+        return self._storage
+
+    @storage.setter
+    def storage(self, options):
+        if options is not None:
+            _check_tools()
+        self._storage = options
+
+    def set_output(self, every=None, timesteps=None, final=False):
+        """ Sets the timesteps at which dynamic values are written, by
+        default each timestep. Options can be combined. The schedule can
+        not be changed once the property set is written.
+
+        :param every: write each n-th timestep
+        :type every: int
+        :param timesteps: timesteps to write
+        :type timesteps: list
+        :param final: write the final timestep
+        :type final: bool
+        """
+
+        if every is not None and every < 1:
+            msg = _color_message(f"Output interval must be positive, got {every}")
+            raise ValueError(msg)
+
+        if timesteps is not None:
+            timesteps = tuple(sorted(set(int(timestep) for timestep in timesteps)))
+
+        if every is None and timesteps is None and not final:
+            self._output = None
+        else:
+            self._output = (every, timesteps, final)
+
+    def output_timesteps(self, nr_timesteps):
+        """ Returns the timesteps at which dynamic values are written
+
+        :param nr_timesteps: number of timesteps of the model
+        :type nr_timesteps: int
+        :rtype: numpy.ndarray
+        """
+
+        if self._output is None:
+            return np.arange(1, nr_timesteps + 1)
+
+        every, timesteps, final = self._output
+
+        steps = []
+        if every is not None:
+            steps.append(np.arange(every, nr_timesteps + 1, every))
+        if timesteps is not None:
+            if timesteps[0] < 1 or timesteps[-1] > nr_timesteps:
+                msg = _color_message(f"Output timesteps must be in range [1, {nr_timesteps}]")
+                raise ValueError(msg)
+            steps.append(np.array(timesteps))
+        if final:
+            steps.append(np.array([nr_timesteps]))
+
+        return np.unique(np.concatenate(steps)).astype(np.int64)
+
     def values(self):
         return self._values
 
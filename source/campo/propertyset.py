@@ -7,6 +7,8 @@ import lue.data_model as ldm
 from .points import Points
 from .areas import Areas
 from .property import Property
+from .relation import Relation
+from .accumulator import Accumulator
 from .utils import TimeDiscretization, _color_message
 
 
@@ -15,6 +17,8 @@ class PropertySet(object):
     def __init__(self, name, nr_agents, space_domain, shape):
 
         self._properties = {}
+        self._relations = {}
+        self._accumulators = {}
         self._name = name
         self._nr_agents = nr_agents
         self._space_domain = space_domain
@@ -61,6 +65,14 @@ class PropertySet(object):
     def properties(self):
         return self._properties
 
+    @property
+    def relations(self):
+        return self._relations
+
+    @property
+    def accumulators(self):
+        return self._accumulators
+
     @property
     def shapes(self):
         return self._shape
@@ -177,8 +189,14 @@ class PropertySet(object):
 
     def __getattr__(self, name):
 
+        # Attributes looked up before initialisation, e.g. when unpickling
+        if name.startswith('_'):
+            raise AttributeError(name)
+
         if name in self._properties:
             return self._properties[name]
+        elif name in self._relations:
+            return self._relations[name]
         else:
             msg = _color_message(f"No property '{name}' in property set '{self._name}'")
             raise TypeError(msg)
@@ -190,6 +208,10 @@ class PropertySet(object):
             self._is_mobile = value
         elif name == "set_coordinates":
             self._set_coordinates(value)
+        elif isinstance(value, Relation):
+            self._add_relation(name, value)
+        elif isinstance(value, Accumulator):
+            self._add_accumulator(name, value)
         else:
             # We assume the modeller wants to access an existing property
             if name in self._properties:
@@ -210,8 +232,52 @@ class PropertySet(object):
                 msg += '\n'
                 msg += self._properties[p].__repr__(indent+2)
 
+        for r in self._relations:
+            msg += '\n'
+            msg += self._relations[r].__repr__(indent+2)
+
         return msg
 
+    def _add_relation(self, name, relation):
+
+        if name in self._properties:
+            msg = _color_message(f"Property set '{self._name}' already contains a property '{name}'")
+            raise ValueError(msg)
+
+        if relation.nr_objects != self._nr_agents:
+            msg = _color_message(f"Number of relation sources ({relation.nr_objects}) does not match number of agents ({self._nr_agents})")
+            raise ValueError(msg)
+
+        relation._name = name
+        relation._pset_uuid = self._uuid
+        self._relations[name] = relation
+
+    def _add_accumulator(self, name, accumulator):
+
+        if name in self._properties or name in self._relations:
+            msg = _color_message(f"Property set '{self._name}' already contains '{name}'")
+            raise ValueError(msg)
+
+        if accumulator.prop.pset_uuid != self._uuid:
+            msg = _color_message(f"Property '{accumulator.prop.name}' is not part of property set '{self._name}'")
+            raise ValueError(msg)
+
+        p = Property(name, self._uuid, self._space_domain, self._shape, np.nan)
+        p.is_dynamic = True
+        if accumulator.window is None:
+            p.set_output(final=True)
+        else:
+            p.set_output(every=accumulator.window, final=True)
+
+        # The LUE time domain is shared by the dynamic properties of a property set
+        for prop in self._properties.values():
+            if prop.is_dynamic and prop._output != p._output:
+                msg = _color_message(f"Dynamic property '{prop.name}' of property set '{self._name}' has a different output schedule than accumulator '{name}', use a separate property set")
+                raise ValueError(msg)
+
+        self._properties[name] = p
+        self._accumulators[name] = accumulator
+
     def get_space_domain(self, timestep=None):
         """ """
 
@@ -0,0 +1,306 @@
+import uuid
+
+import numpy as np
+
+from .utils import _color_message
+
+
+class Relation(object):
+    """ Sparse relation between agents, e.g. a neighbour network
+
+    Edges are stored in compressed sparse row (CSR) layout: the targets of
+    source agent i are indices[indptr[i]:indptr[i + 1]], with corresponding
+    weights. Memory use is proportional to the number of edges.
+
+    Edges can be added and removed in batches. Changes are collected and
+    merged into the CSR layout only once the relation is read.
+    """
+
+    def __init__(self, nr_sources, indptr, indices, weights=None, nr_targets=None, name=None):
+
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int64)
+
+        if indptr.shape != (nr_sources + 1,):
+            msg = _color_message(f'Number of row offsets ({indptr.shape[0]}) does not match number of agents ({nr_sources}) + 1')
+            raise ValueError(msg)
+
+        if indptr[-1] != indices.shape[0]:
+            msg = _color_message(f'Number of edges ({indices.shape[0]}) does not match last row offset ({indptr[-1]})')
+            raise ValueError(msg)
+
+        if weights is None:
+            weights = np.ones(indices.shape[0], dtype=np.float64)
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != indices.shape:
+                msg = _color_message(f'Number of weights ({weights.shape[0]}) does not match number of edges ({indices.shape[0]})')
+                raise ValueError(msg)
+
+        self._name = name
+        self._uuid = uuid.uuid4()
+        self._pset_uuid = None
+        self._nr_sources = nr_sources
+        self._nr_targets = nr_sources if nr_targets is None else nr_targets
+
+        self._indptr = indptr
+        self._indices = indices
+        self._weights = weights
+
+        # Source agent per edge, computed on first use
+        self._sources = None
+
+        # Pending changes, merged on first read
+        self._added = []
+        self._removed = []
+
+        # Incremented on each change of the edges
+        self._version = 0
+
+    @classmethod
+    def from_edges(cls, nr_sources, sources, targets, weights=None, nr_targets=None, name=None):
+        """ Returns a relation from edge lists, duplicate edges are kept
+
+        :param nr_sources: number of source agents
+        :type nr_sources: int
+        :param sources: source agent index per edge
+        :type sources: numpy.ndarray
+        :param targets: target agent index per edge
+        :type targets: numpy.ndarray
+        :param weights: weight per edge, defaults to 1
+        :type weights: numpy.ndarray
+        """
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        order = np.lexsort((targets, sources))
+        counts = np.bincount(sources, minlength=nr_sources)
+
+        indptr = np.zeros(nr_sources + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[order]
+
+        return cls(nr_sources, indptr, targets[order], weights, nr_targets, name)
+
+    @classmethod
+    def from_dense(cls, matrix, name=None):
+        """ Returns a relation from a dense adjacency matrix, non-zero entries are edges """
+
+        matrix = np.asarray(matrix)
+        sources, targets = np.nonzero(matrix)
+
+        return cls.from_edges(matrix.shape[0], sources, targets, matrix[sources, targets], matrix.shape[1], name)
+
+    def add_edges(self, sources, targets, weights=None, symmetric=False):
+        """ Adds a batch of edges
+
+        :param sources: source agent index per edge
+        :type sources: numpy.ndarray
+        :param targets: target agent index per edge
+        :type targets: numpy.ndarray
+        :param weights: weight per edge, defaults to 1
+        :type weights: numpy.ndarray
+        :param symmetric: also add the edges from target to source
+        :type symmetric: bool
+        """
+
+        sources = np.atleast_1d(np.asarray(sources, dtype=np.int64))
+        targets = np.atleast_1d(np.asarray(targets, dtype=np.int64))
+
+        if weights is None:
+            weights = np.ones(sources.shape[0], dtype=np.float64)
+        else:
+            weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), sources.shape)
+
+        self._check_edges(sources, targets)
+
+        self._added.append((sources, targets, weights))
+        if symmetric:
+            self._added.append((targets, sources, weights))
+
+        self._version += 1
+
+    def remove_edges(self, sources, targets, symmetric=False):
+        """ Removes a batch of edges, including duplicates, absent edges are ignored
+
+        :param sources: source agent index per edge
+        :type sources: numpy.ndarray
+        :param targets: target agent index per edge
+        :type targets: numpy.ndarray
+        :param symmetric: also remove the edges from target to source
+        :type symmetric: bool
+        """
+
+        sources = np.atleast_1d(np.asarray(sources, dtype=np.int64))
+        targets = np.atleast_1d(np.asarray(targets, dtype=np.int64))
+
+        self._check_edges(sources, targets)
+
+        keys = sources * self._nr_targets + targets
+        if symmetric:
+            keys = np.concatenate((keys, targets * self._nr_targets + sources))
+
+        # Edges added before this removal are removed as well
+        if len(self._added) > 0:
+            sources, targets, weights = (np.concatenate(item) for item in zip(*self._added))
+            keep = ~np.isin(sources * self._nr_targets + targets, keys)
+            self._added = [(sources[keep], targets[keep], weights[keep])]
+
+        self._removed.append(keys)
+        self._version += 1
+
+    def _check_edges(self, sources, targets):
+
+        if sources.shape != targets.shape:
+            msg = _color_message(f'Number of sources ({sources.shape[0]}) does not match number of targets ({targets.shape[0]})')
+            raise ValueError(msg)
+
+        if np.any((sources < 0) | (sources >= self._nr_sources)) or np.any((targets < 0) | (targets >= self._nr_targets)):
+            msg = _color_message(f'Edges must connect agents in range [0, {self._nr_sources}) to agents in range [0, {self._nr_targets})')
+            raise ValueError(msg)
+
+    def _consolidate(self):
+        """ Merges pending changes into the CSR layout """
+
+        if len(self._added) == 0 and len(self._removed) == 0:
+            return
+
+        sources = np.repeat(np.arange(self._nr_sources), np.diff(self._indptr))
+        targets = self._indices
+        weights = self._weights
+
+        if len(self._removed) > 0:
+            keep = ~np.isin(sources * self._nr_targets + targets, np.concatenate(self._removed))
+            sources = sources[keep]
+            targets = targets[keep]
+            weights = weights[keep]
+
+        if len(self._added) > 0:
+            added = [np.concatenate(item) for item in zip(*self._added)]
+            sources = np.concatenate((sources, added[0]))
+            targets = np.concatenate((targets, added[1]))
+            weights = np.concatenate((weights, added[2]))
+
+        order = np.lexsort((targets, sources))
+
+        self._indptr = np.zeros(self._nr_sources + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self._nr_sources), out=self._indptr[1:])
+        self._indices = targets[order]
+        self._weights = weights[order]
+
+        self._sources = None
+        self._added = []
+        self._removed = []
+
+    def to_dense(self, dtype=np.float64):
+        """ Returns the relation as dense adjacency matrix of shape (nr_objects, nr_targets),
+        weights of duplicate edges are summed
+        """
+
+        self._consolidate()
+
+        matrix = np.zeros((self._nr_sources, self._nr_targets), dtype=dtype)
+        np.add.at(matrix, (self.sources(), self._indices), self._weights)
+
+        return matrix
+
+    def sources(self):
+        """ Returns the source agent index per edge """
+
+        self._consolidate()
+
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(self._nr_sources), self.degree())
+
+        return self._sources
+
+    def dot(self, values, weighted=True):
+        """ Returns per source agent the sum of the values of its targets
+
+        :param values: one value per target agent
+        :type values: numpy.ndarray
+        :param weighted: multiply target values by the edge weights
+        :type weighted: bool
+        :returns: sparse matrix-vector product, one value per source agent
+        :rtype: numpy.ndarray
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+
+        if values.shape != (self._nr_targets,):
+            msg = _color_message(f'Number of values ({values.shape[0]}) does not match number of targets ({self._nr_targets})')
+            raise ValueError(msg)
+
+        self._consolidate()
+
+        edge_values = values[self._indices]
+        if weighted:
+            edge_values = edge_values * self._weights
+
+        return np.bincount(self.sources(), weights=edge_values, minlength=self._nr_sources)
+
+    def neighbours(self, idx):
+        """ Returns the target indices of source agent idx """
+
+        self._consolidate()
+
+        return self._indices[self._indptr[idx]:self._indptr[idx + 1]]
+
+    def degree(self):
+        """ Returns the number of outgoing edges per source agent """
+
+        self._consolidate()
+
+        return np.diff(self._indptr)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def uuid(self):
+        return self._uuid
+
+    @property
+    def pset_uuid(self):
+        return self._pset_uuid
+
+    @property
+    def nr_objects(self):
+        return self._nr_sources
+
+    @property
+    def nr_targets(self):
+        return self._nr_targets
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def nr_edges(self):
+        self._consolidate()
+        return self._indices.shape[0]
+
+    @property
+    def indptr(self):
+        self._consolidate()
+        return self._indptr
+
+    @property
+    def indices(self):
+        self._consolidate()
+        return self._indices
+
+    @property
+    def weights(self):
+        self._consolidate()
+        return self._weights
+
+    def __repr__(self, indent=0):
+        msg = '{}Relation: {} ({} edges)'.format('  ' * indent, self.name, self.nr_edges)
+
+        return msg
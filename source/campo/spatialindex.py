@@ -0,0 +1,478 @@
+import math
+import numpy as np
+
+from .utils import _expand_ranges
+
+
+class GridIndex(object):
+    """ Cell list index on point locations
+
+    Points are binned in a regular grid of square cells, neighbourhood
+    queries only visit the cells near a query location. For mobile agents
+    the index follows coordinate updates incrementally: only agents that
+    moved out of their cell are re-indexed, and the grid is rebuilt once
+    too many agents moved or left the grid extent.
+
+    :param xcoord: x coordinates of the points
+    :type xcoord: numpy.ndarray
+    :param ycoord: y coordinates of the points
+    :type ycoord: numpy.ndarray
+    :param cellsize: cell size of the grid, derived from the point density if None
+    :type cellsize: float
+    :param rebuild_fraction: fraction of moved agents triggering a rebuild
+    :type rebuild_fraction: float
+    """
+
+    # Average number of points per cell when deriving the cell size
+    points_per_cell = 2
+
+    # Maximum number of cell lookups per batch of queries
+    batch_size = 2**20
+
+    def __init__(self, xcoord, ycoord, cellsize=None, rebuild_fraction=0.1):
+
+        self._cellsize = cellsize
+        self._fixed_cellsize = cellsize is not None
+        self.rebuild_fraction = rebuild_fraction
+
+        self.nr_rebuilds = 0
+
+        self._build(xcoord, ycoord)
+
+    @property
+    def nr_items(self):
+        return self._nr_items
+
+    @property
+    def cellsize(self):
+        return self._cellsize
+
+    @property
+    def nr_moved(self):
+        """ Number of agents currently indexed outside the main cell list """
+        return len(self._moved)
+
+    def _derive_cellsize(self):
+
+        width = self._xmax - self._xmin
+        height = self._ymax - self._ymin
+        nr_items = max(self._nr_items, 1)
+
+        if width > 0 and height > 0:
+            return math.sqrt(width * height * self.points_per_cell / nr_items)
+        elif width > 0 or height > 0:
+            return max(width, height) * self.points_per_cell / nr_items
+
+        return 1.0
+
+    def _build(self, xcoord, ycoord):
+
+        self._x = np.array(xcoord, dtype=np.float64)
+        self._y = np.array(ycoord, dtype=np.float64)
+        self._nr_items = len(self._x)
+
+        if self._nr_items > 0:
+            self._xmin = self._x.min()
+            self._xmax = self._x.max()
+            self._ymin = self._y.min()
+            self._ymax = self._y.max()
+        else:
+            self._xmin = self._xmax = self._ymin = self._ymax = 0.0
+
+        if not self._fixed_cellsize:
+            self._cellsize = self._derive_cellsize()
+
+        self._nr_cols = max(1, int(math.ceil((self._xmax - self._xmin) / self._cellsize)))
+        self._nr_rows = max(1, int(math.ceil((self._ymax - self._ymin) / self._cellsize)))
+
+        self._cells, nr_outside = self._cell_of(self._x, self._y)
+
+        # Main cell list, agents ordered by cell
+        self._main_cells = self._cells.copy()
+        self._order = np.argsort(self._main_cells, kind='stable')
+        counts = np.bincount(self._main_cells, minlength=self._nr_rows * self._nr_cols)
+        self._cell_start = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._cell_start[1:])
+
+        # Agents that left their cell since the last rebuild, ordered by current cell
+        self._moved = np.empty(0, dtype=np.int64)
+        self._moved_cells = np.empty(0, dtype=np.int64)
+
+        self.nr_rebuilds += 1
+
+    def _rows_cols(self, xcoord, ycoord):
+
+        cols = np.floor((xcoord - self._xmin) / self._cellsize)
+        rows = np.floor((ycoord - self._ymin) / self._cellsize)
+
+        outside = (xcoord < self._xmin) | (xcoord > self._xmin + self._nr_cols * self._cellsize) | \
+                  (ycoord < self._ymin) | (ycoord > self._ymin + self._nr_rows * self._cellsize)
+
+        # Locations outside the grid are assigned to the nearest border cell
+        cols = np.clip(cols, 0, self._nr_cols - 1).astype(np.int64)
+        rows = np.clip(rows, 0, self._nr_rows - 1).astype(np.int64)
+
+        return rows, cols, outside
+
+    def _cell_of(self, xcoord, ycoord):
+
+        rows, cols, outside = self._rows_cols(xcoord, ycoord)
+
+        return rows * self._nr_cols + cols, np.count_nonzero(outside)
+
+    def update(self, xcoord, ycoord):
+        """ Updates the index to new point locations
+
+        :param xcoord: x coordinates of the points
+        :type xcoord: numpy.ndarray
+        :param ycoord: y coordinates of the points
+        :type ycoord: numpy.ndarray
+        """
+        if len(xcoord) != self._nr_items:
+            self._build(xcoord, ycoord)
+            return
+
+        x = np.array(xcoord, dtype=np.float64)
+        y = np.array(ycoord, dtype=np.float64)
+
+        cells, nr_outside = self._cell_of(x, y)
+
+        moved = np.flatnonzero(cells != self._main_cells)
+
+        limit = self.rebuild_fraction * self._nr_items
+        if len(moved) > limit or nr_outside > limit:
+            self._build(x, y)
+            return
+
+        self._x = x
+        self._y = y
+        self._cells = cells
+
+        order = np.argsort(cells[moved], kind='stable')
+        self._moved = moved[order]
+        self._moved_cells = cells[self._moved]
+
+    def _candidates(self, rows, cols, reach):
+        """ Returns pairs of query index and agent index for all agents
+        located in the cells within reach of the query cells
+        """
+        offsets = np.arange(-reach, reach + 1)
+        row_offsets, col_offsets = np.meshgrid(offsets, offsets, indexing='ij')
+
+        cell_rows = rows[:, np.newaxis] + row_offsets.ravel()
+        cell_cols = cols[:, np.newaxis] + col_offsets.ravel()
+
+        valid = (cell_rows >= 0) & (cell_rows < self._nr_rows) & (cell_cols >= 0) & (cell_cols < self._nr_cols)
+
+        queries = np.broadcast_to(np.arange(len(rows))[:, np.newaxis], cell_rows.shape)[valid]
+        cells = (cell_rows * self._nr_cols + cell_cols)[valid]
+
+        start = self._cell_start[cells]
+        owner, positions = _expand_ranges(start, self._cell_start[cells + 1] - start)
+        agents = self._order[positions]
+        queries_main = queries[owner]
+
+        if len(self._moved) == 0:
+            return queries_main, agents
+
+        # Skip stale entries of the main cell list, add the moved agents instead
+        current = self._cells[agents] == self._main_cells[agents]
+        agents = agents[current]
+        queries_main = queries_main[current]
+
+        lower = np.searchsorted(self._moved_cells, cells, side='left')
+        upper = np.searchsorted(self._moved_cells, cells, side='right')
+        owner, positions = _expand_ranges(lower, upper - lower)
+
+        return np.concatenate((queries_main, queries[owner])), np.concatenate((agents, self._moved[positions]))
+
+    def _batches(self, nr_queries, reach):
+
+        step = max(1, self.batch_size // (2 * reach + 1)**2)
+
+        for start in range(0, nr_queries, step):
+            yield np.arange(start, min(start + step, nr_queries))
+
+    def query_radius(self, xcoord, ycoord, radius, exclude_self=False):
+        """ Returns the indexed points within a distance of the query locations
+
+        :param xcoord: x coordinates of the query locations
+        :type xcoord: numpy.ndarray
+        :param ycoord: y coordinates of the query locations
+        :type ycoord: numpy.ndarray
+        :param radius: search distance, one for all or one per query location
+        :type radius: float or numpy.ndarray
+        :param exclude_self: omit the point with the same index as the query location
+        :type exclude_self: bool
+        :returns: neighbours in compressed sparse row layout, as offsets
+                  per query location, point indices and distances
+        :rtype: tuple of numpy.ndarray
+        """
+        x = np.asarray(xcoord, dtype=np.float64)
+        y = np.asarray(ycoord, dtype=np.float64)
+        nr_queries = len(x)
+
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (nr_queries,))
+        rows, cols, outside = self._rows_cols(x, y)
+
+        max_radius = radius.max() if nr_queries > 0 else 0.0
+        reach = int(math.ceil(max_radius / self._cellsize))
+
+        found_queries = []
+        found_agents = []
+        found_distances = []
+
+        for batch in self._batches(nr_queries, reach):
+            queries, agents = self._candidates(rows[batch], cols[batch], reach)
+            queries = batch[queries]
+
+            distances = np.hypot(self._x[agents] - x[queries], self._y[agents] - y[queries])
+
+            keep = distances <= radius[queries]
+            if exclude_self:
+                keep &= agents != queries
+
+            found_queries.append(queries[keep])
+            found_agents.append(agents[keep])
+            found_distances.append(distances[keep])
+
+        queries = np.concatenate(found_queries) if found_queries else np.empty(0, dtype=np.int64)
+        agents = np.concatenate(found_agents) if found_agents else np.empty(0, dtype=np.int64)
+        distances = np.concatenate(found_distances) if found_distances else np.empty(0)
+
+        order = np.lexsort((agents, queries))
+
+        indptr = np.zeros(nr_queries + 1, dtype=np.int64)
+        np.cumsum(np.bincount(queries, minlength=nr_queries), out=indptr[1:])
+
+        return indptr, agents[order], distances[order]
+
+    def query_knn(self, xcoord, ycoord, k, exclude_self=False):
+        """ Returns the k nearest indexed points of the query locations
+
+        :param xcoord: x coordinates of the query locations
+        :type xcoord: numpy.ndarray
+        :param ycoord: y coordinates of the query locations
+        :type ycoord: numpy.ndarray
+        :param k: number of neighbours
+        :type k: int
+        :param exclude_self: omit the point with the same index as the query location
+        :type exclude_self: bool
+        :returns: point indices and distances of shape (queries, k), ordered by
+                  distance, padded with -1 and NaN if less than k points exist
+        :rtype: tuple of numpy.ndarray
+        """
+        x = np.asarray(xcoord, dtype=np.float64)
+        y = np.asarray(ycoord, dtype=np.float64)
+        nr_queries = len(x)
+
+        indices = np.full((nr_queries, k), -1, dtype=np.int64)
+        distances = np.full((nr_queries, k), np.nan)
+
+        if k < 1 or self._nr_items == 0:
+            return indices, distances
+
+        rows, cols, outside = self._rows_cols(x, y)
+
+        # Start with the square of cells expected to hold k points
+        density = self._nr_items / (self._nr_rows * self._nr_cols)
+        reach = max(1, int(math.ceil((math.sqrt(k / density) - 1) / 2)))
+        max_reach = max(self._nr_rows, self._nr_cols)
+
+        pending = np.arange(nr_queries)
+
+        while len(pending) > 0:
+            unresolved = []
+
+            for batch in self._batches(len(pending), reach):
+                batch = pending[batch]
+                queries, agents = self._candidates(rows[batch], cols[batch], reach)
+
+                if exclude_self:
+                    keep = agents != batch[queries]
+                    queries = queries[keep]
+                    agents = agents[keep]
+
+                dist = np.hypot(self._x[agents] - x[batch[queries]], self._y[agents] - y[batch[queries]])
+
+                order = np.lexsort((agents, dist, queries))
+                queries = queries[order]
+                agents = agents[order]
+                dist = dist[order]
+
+                counts = np.bincount(queries, minlength=len(batch))
+                starts = np.cumsum(counts) - counts
+                rank = np.arange(len(queries)) - starts[queries]
+
+                # Points outside the searched cells are further away than reach cells
+                kth = np.full(len(batch), np.inf)
+                complete = counts >= k
+                kth[complete] = dist[starts[complete] + k - 1]
+                done = kth <= reach * self._cellsize
+                if reach >= max_reach:
+                    done[:] = True
+
+                select = (rank < k) & done[queries]
+                indices[batch[queries[select]], rank[select]] = agents[select]
+                distances[batch[queries[select]], rank[select]] = dist[select]
+
+                unresolved.append(batch[~done])
+
+            pending = np.concatenate(unresolved)
+            reach *= 2
+
+        return indices, distances
+
+
+class ExtentIndex(object):
+    """ Bucket index on the extents of field agents
+
+    Each extent is registered in the buckets of a regular grid it overlaps,
+    locating points only visits the extents registered in the bucket of
+    each point. Extents include their borders, points on the lower or right
+    border are assigned to the last row or column.
+
+    :param xmin: western boundaries
+    :type xmin: numpy.ndarray
+    :param ymin: southern boundaries
+    :type ymin: numpy.ndarray
+    :param xmax: eastern boundaries
+    :type xmax: numpy.ndarray
+    :param ymax: northern boundaries
+    :type ymax: numpy.ndarray
+    :param nr_rows: number of rows of each extent
+    :type nr_rows: numpy.ndarray
+    :param nr_cols: number of columns of each extent
+    :type nr_cols: numpy.ndarray
+    """
+
+    def __init__(self, xmin, ymin, xmax, ymax, nr_rows, nr_cols):
+
+        xmin = np.asarray(xmin, dtype=np.float64)
+        ymin = np.asarray(ymin, dtype=np.float64)
+        xmax = np.asarray(xmax, dtype=np.float64)
+        ymax = np.asarray(ymax, dtype=np.float64)
+
+        self.xmin = np.minimum(xmin, xmax)
+        self.xmax = np.maximum(xmin, xmax)
+        self.ymin = np.minimum(ymin, ymax)
+        self.ymax = np.maximum(ymin, ymax)
+
+        self.nr_rows = np.asarray(nr_rows, dtype=np.int64)
+        self.nr_cols = np.asarray(nr_cols, dtype=np.int64)
+
+        self.cellsize_x = (self.xmax - self.xmin) / self.nr_cols
+        self.cellsize_y = (self.ymax - self.ymin) / self.nr_rows
+
+        self._nr_items = len(self.xmin)
+
+        self._build()
+
+    @property
+    def nr_items(self):
+        return self._nr_items
+
+    def _build(self):
+
+        if self._nr_items == 0:
+            self._x0 = self._y0 = 0.0
+            self._bucketsize = 1.0
+            self._nr_bucket_rows = self._nr_bucket_cols = 1
+            self._bucket_start = np.zeros(2, dtype=np.int64)
+            self._bucket_agents = np.empty(0, dtype=np.int64)
+            return
+
+        self._x0 = self.xmin.min()
+        self._y0 = self.ymin.min()
+        width = self.xmax.max() - self._x0
+        height = self.ymax.max() - self._y0
+
+        # Typical extents overlap a few buckets, limit the number of buckets
+        bucketsize = max(np.median(self.xmax - self.xmin), np.median(self.ymax - self.ymin))
+        bucketsize = max(bucketsize, math.sqrt(width * height / (4 * self._nr_items)))
+        if bucketsize <= 0:
+            bucketsize = max(width, height, 1.0)
+        self._bucketsize = bucketsize
+
+        self._nr_bucket_cols = max(1, int(math.ceil(width / bucketsize)))
+        self._nr_bucket_rows = max(1, int(math.ceil(height / bucketsize)))
+
+        col_first, row_first = self._bucket_of(self.xmin, self.ymin)
+        col_last, row_last = self._bucket_of(self.xmax, self.ymax)
+
+        widths = col_last - col_first + 1
+        heights = row_last - row_first + 1
+
+        agents, positions = _expand_ranges(np.zeros(self._nr_items), widths * heights)
+        rows = row_first[agents] + positions // widths[agents]
+        cols = col_first[agents] + positions % widths[agents]
+        buckets = rows * self._nr_bucket_cols + cols
+
+        order = np.argsort(buckets, kind='stable')
+        self._bucket_agents = agents[order]
+
+        counts = np.bincount(buckets, minlength=self._nr_bucket_rows * self._nr_bucket_cols)
+        self._bucket_start = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._bucket_start[1:])
+
+    def _bucket_of(self, xcoord, ycoord):
+
+        cols = np.floor((xcoord - self._x0) / self._bucketsize)
+        rows = np.floor((ycoord - self._y0) / self._bucketsize)
+
+        cols = np.clip(cols, 0, self._nr_bucket_cols - 1).astype(np.int64)
+        rows = np.clip(rows, 0, self._nr_bucket_rows - 1).astype(np.int64)
+
+        return cols, rows
+
+    def cell_indices(self, agents, xcoord, ycoord):
+        """ Returns the row and column of locations in the raster of field agents
+
+        :param agents: field agent index for each location
+        :type agents: numpy.ndarray
+        :param xcoord: x coordinates of the locations
+        :type xcoord: numpy.ndarray
+        :param ycoord: y coordinates of the locations
+        :type ycoord: numpy.ndarray
+        :returns: rows and columns, clipped to the raster of the agent
+        :rtype: tuple of numpy.ndarray
+        """
+        cols = np.floor((xcoord - self.xmin[agents]) / self.cellsize_x[agents])
+        rows = np.floor((self.ymax[agents] - ycoord) / self.cellsize_y[agents])
+
+        cols = np.clip(cols, 0, self.nr_cols[agents] - 1).astype(np.int64)
+        rows = np.clip(rows, 0, self.nr_rows[agents] - 1).astype(np.int64)
+
+        return rows, cols
+
+    def query(self, xcoord, ycoord):
+        """ Returns the field agents containing the locations, and the cell of each location
+
+        :param xcoord: x coordinates of the locations
+        :type xcoord: numpy.ndarray
+        :param ycoord: y coordinates of the locations
+        :type ycoord: numpy.ndarray
+        :returns: one entry per containing field agent of a location, as
+                  location index, field agent index, row and column,
+                  ordered by location and field agent
+        :rtype: tuple of numpy.ndarray
+        """
+        x = np.asarray(xcoord, dtype=np.float64)
+        y = np.asarray(ycoord, dtype=np.float64)
+
+        cols, rows = self._bucket_of(x, y)
+        buckets = rows * self._nr_bucket_cols + cols
+
+        start = self._bucket_start[buckets]
+        points, positions = _expand_ranges(start, self._bucket_start[buckets + 1] - start)
+        agents = self._bucket_agents[positions]
+
+        inside = (x[points] >= self.xmin[agents]) & (x[points] <= self.xmax[agents]) & \
+                 (y[points] >= self.ymin[agents]) & (y[points] <= self.ymax[agents])
+
+        points = points[inside]
+        agents = agents[inside]
+
+        rows, cols = self.cell_indices(agents, x[points], y[points])
+
+        return points, agents, rows, cols
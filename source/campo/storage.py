@@ -0,0 +1,199 @@
+import os
+import shutil
+import subprocess
+
+from .utils import _color_message
+
+
+class StorageOptions(object):
+    """ HDF5 storage layout of LUE output
+
+    The LUE API creates datasets with the default HDF5 layout. The options
+    are applied after the run by Campo.repack, rewriting the file with
+    h5repack. Setting options requires h5py and h5repack from the HDF5
+    tools on the path.
+
+    :param chunks: chunk shape, e.g. (1, rows, cols) to store one timestep
+        of a field agent per chunk
+    :type chunks: tuple
+    :param compression: compression filter, 'gzip' or 'szip'
+    :type compression: str
+    :param level: gzip compression level (1-9), or szip pixels per block
+    :type level: int
+    :param shuffle: apply the byte shuffle filter before compression
+    :type shuffle: bool
+    """
+
+    def __init__(self, chunks=None, compression=None, level=4, shuffle=False):
+
+        if compression not in (None, 'gzip', 'szip'):
+            msg = _color_message(f"Compression '{compression}' is not supported, use 'gzip' or 'szip'")
+            raise ValueError(msg)
+
+        if compression == 'gzip' and not 1 <= level <= 9:
+            msg = _color_message(f"Compression level must be in range [1, 9], got {level}")
+            raise ValueError(msg)
+
+        if chunks is not None and any(int(size) < 1 for size in chunks):
+            msg = _color_message(f"Chunk sizes must be positive, got {tuple(chunks)}")
+            raise ValueError(msg)
+
+        self._chunks = None if chunks is None else tuple(int(size) for size in chunks)
+        self._compression = compression
+        self._level = level
+        self._shuffle = shuffle
+
+    @property
+    def chunks(self):
+        return self._chunks
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @property
+    def level(self):
+        return self._level
+
+    @property
+    def shuffle(self):
+        return self._shuffle
+
+    def _filters(self):
+        """ Returns the h5repack filter arguments, in order of application """
+
+        filters = []
+
+        if self._shuffle:
+            filters.append('SHUF')
+
+        if self._compression == 'gzip':
+            filters.append(f'GZIP={self._level}')
+        elif self._compression == 'szip':
+            filters.append(f'SZIP={self._level},NN')
+
+        return filters
+
+    def __repr__(self, indent=0):
+        msg = '{}StorageOptions: chunks={}, compression={}, level={}, shuffle={}'.format(
+            '  ' * indent, self._chunks, self._compression, self._level, self._shuffle)
+
+        return msg
+
+
+def _timestep_chunks(shape):
+    """ Returns chunks holding one timestep of a field agent with values of shape (timesteps, rows, cols) """
+
+    if len(shape) != 3:
+        return None
+
+    return (1,) + shape[1:]
+
+
+def _check_tools():
+    """ Raises in case h5py or the HDF5 tools used to apply storage options are missing """
+
+    try:
+        import h5py
+    except ImportError:
+        msg = _color_message("Storage options require the h5py package")
+        raise RuntimeError(msg)
+
+    if shutil.which('h5repack') is None:
+        msg = _color_message("Storage options require 'h5repack' from the HDF5 tools on the path")
+        raise RuntimeError(msg)
+
+
+def _format_chunks(chunks):
+    return 'x'.join(str(size) for size in chunks)
+
+
+def _hdf5_datasets(filename):
+    """ Returns the path and shape of each non-empty HDF5 dataset in a file """
+
+    import h5py
+
+    datasets = {}
+
+    def add(name, item):
+        if isinstance(item, h5py.Dataset) and item.ndim > 0 and item.size > 0:
+            datasets[f'/{name}'] = item.shape
+
+    with h5py.File(filename, 'r') as content:
+        content.visititems(add)
+
+    return datasets
+
+
+def _property_datasets(datasets, phen_name, pset_name, prop_name):
+    """ Returns the paths of the datasets holding the values of a property """
+
+    paths = []
+    for path in datasets:
+        names = iter(path.strip('/').split('/'))
+        # Group names in order of the LUE hierarchy
+        if all(name in names for name in (phen_name, pset_name, prop_name)):
+            paths.append(path)
+
+    return paths
+
+
+def _repack(filename, storage, properties):
+    """ Rewrites a LUE dataset with storage options
+
+    :param storage: options for all datasets, or None
+    :param properties: list of (phenomenon name, property set name,
+        property name, options, default chunks per dataset shape)
+    """
+
+    _check_tools()
+
+    datasets = _hdf5_datasets(filename)
+
+    # Chunks per dataset, chunks for all datasets apply to datasets of equal rank only
+    layouts = {}
+    if storage is not None and storage.chunks is not None:
+        for path, shape in datasets.items():
+            if len(shape) == len(storage.chunks):
+                layouts[path] = storage.chunks
+
+    filters = []
+    if storage is not None:
+        for item in storage._filters():
+            filters += ['-f', item]
+
+    for phen_name, pset_name, prop_name, options, default_chunks in properties:
+        paths = _property_datasets(datasets, phen_name, pset_name, prop_name)
+        if len(paths) == 0:
+            continue
+
+        # Options for specific objects replace the ones for all datasets
+        for item in options._filters():
+            filters += ['-f', ','.join(paths) + ':' + item]
+
+        for path in paths:
+            chunks = options.chunks
+            if chunks is None and default_chunks is not None:
+                chunks = default_chunks(datasets[path])
+            if chunks is None:
+                continue
+
+            if len(chunks) != len(datasets[path]):
+                msg = _color_message(f"Chunks {chunks} of property '{prop_name}' do not match rank {len(datasets[path])} of dataset '{path}'")
+                raise ValueError(msg)
+
+            layouts[path] = chunks
+
+    args = filters
+    for path, chunks in layouts.items():
+        args += ['-l', f'{path}:CHUNK={_format_chunks(chunks)}']
+
+    if len(args) == 0:
+        return
+
+    root, ext = os.path.splitext(filename)
+    tmp_filename = f'{root}_repack{ext}'
+
+    # Filters also apply to datasets smaller than the default h5repack threshold of 1 KiB
+    subprocess.check_call(['h5repack', '-m', '1'] + args + [filename, tmp_filename], stdout=subprocess.DEVNULL)
+    os.replace(tmp_filename, filename)
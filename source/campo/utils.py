@@ -1,5 +1,7 @@
 import enum
 
+import numpy as np
+
 import lue.data_model as ldm
 
 
@@ -9,6 +11,29 @@ def _color_message(message, colour_start='\033[31m'):
     return f'{colour_start}{message}{colour_end}'
 
 
+def _expand_ranges(starts, counts):
+    """ Expands ranges given by start and count into flat positions
+
+    Returns for each position the index of the range it belongs to, and the
+    position itself, e.g. starts (3, 7) and counts (2, 1) give (0, 0, 1)
+    and (3, 4, 7).
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    positions = np.arange(owner.size) - offsets[owner] + starts[owner]
+
+    return owner, positions
+
+
+def _relation_phenomenon(phen_name, pset_name, relation_name):
+    """ Returns the name of the LUE phenomenon holding the edges of a relation """
+
+    return f'{phen_name}_{pset_name}_{relation_name}'
+
+
 class TimeDomain(enum.Enum):
     """ Enum to indicate time domain of a property set """
     static = 1
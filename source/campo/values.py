@@ -27,6 +27,24 @@ class Values(object):
 
         dim = len(shapes[0])
 
+        if values.ndim == 2 and dim == 1 and values.shape[1:] == tuple(shapes[0]):
+            # Several values per agent, one row per agent
+            if len(shapes) != values.shape[0]:
+                msg = f"Number of provided values ({values.shape[0]}) does not match number of agents ({len(shapes)})"
+                raise ValueError(msg)
+
+            self.values = OrderedDict(enumerate(values.copy()))
+            return
+
+        if values.ndim == 1 and dim == 1 and tuple(shapes[0]) == (1,):
+            # One value per agent
+            if len(shapes) != values.shape[0]:
+                msg = f"Number of provided values ({values.shape[0]}) does not match number of agents ({len(shapes)})"
+                raise ValueError(msg)
+
+            self.values = OrderedDict(enumerate(values.reshape(-1, 1).copy()))
+            return
+
         if values.ndim == 2:
             msg = f"Array of shape ({values.shape[0]}, {values.shape[1]}) cannot be assigned to one agent, use shape (1, {values.shape[0]}, {values.shape[1]})"
             raise ValueError(msg)
@@ -66,6 +84,32 @@ class Values(object):
         for idx, shape in enumerate(shapes):
             self.values[idx] = values.values().values[idx]
 
+    def _flatten(self):
+        """ Returns the values of all agents as one flat array, and the
+        offset of each agent in that array
+        """
+        arrays = [np.ravel(self.values[idx]) for idx in range(self.nr_objects)]
+
+        sizes = np.fromiter((a.size for a in arrays), dtype=np.int64, count=len(arrays))
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        if len(arrays) == 0:
+            return np.empty(0), offsets
+
+        return np.concatenate(arrays), offsets
+
+    @classmethod
+    def _from_arrays(cls, arrays):
+        """ Returns values from one array per agent, e.g. the rows of a stacked array """
+        result = cls.__new__(cls)
+
+        result.iter_idx = 0
+        result.values = OrderedDict(enumerate(arrays))
+        result.nr_objects = len(result.values)
+
+        return result
+
     def __setitem__(self, index, value):
 
         if index < 0 or index > self.nr_objects:
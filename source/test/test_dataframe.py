@@ -1,3 +1,4 @@
+import datetime
 import pathlib
 import unittest
 
@@ -81,3 +82,88 @@ class TestDataframe(unittest.TestCase):
             raster = df["phen2"]["field"]["fdata"][agent_id][timestep - 1]
             filename = pathlib.Path(directory, f"fdata_{agent_id}_{timestep}.tiff")
             campo.to_geotiff(raster, filename, crs)
+
+    def test_5(self):
+        """ Dynamic point agents of a single timestep """
+
+        with open("dataframe_locations.csv", "w") as content:
+            content.write("1,2\n3,4\n5,6\n")
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "dataframe_locations.csv")
+        phen.point.pdata = 500
+
+        filename = "TestDataframe_test_5.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(datetime.datetime(2000, 1, 1), campo.TimeUnit.month, 1, 1)
+
+            phen.point.pdata.is_dynamic = True
+
+            ds.write()
+            phen.point.pdata += 200
+            ds.write(1)
+
+        dataset = ldm.open_dataset(filename, "r")
+        df = campo.dataframe.select(dataset.phen, property_names=["pdata"])
+
+        values = df["phen"]["point"]["pdata"]["values"]
+        self.assertEqual(("id", "time"), values.dims)
+        self.assertTrue(np.array_equal(np.full((3, 1), 700), values.values))
+
+    def test_6(self):
+        """ Reading dynamic properties written on output schedules """
+
+        with open("dataframe_locations.csv", "w") as content:
+            content.write("1,2\n3,4\n5,6\n")
+
+        with open("dataframe_extent.csv", "w") as content:
+            content.write("0,0,30,20,2,3\n" * 3)
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "dataframe_locations.csv")
+        phen.add_property_set("field", "dataframe_extent.csv")
+
+        phen.point.pdata = 0
+        phen.field.fdata = 0
+
+        filename = "TestDataframe_test_6.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(datetime.datetime(2000, 1, 1), campo.TimeUnit.month, 1, 5)
+
+            phen.point.pdata.is_dynamic = True
+            phen.point.pdata.set_output(every=2)
+            phen.field.fdata.is_dynamic = True
+            phen.field.fdata.set_output(final=True)
+
+            ds.write()
+
+            for timestep in range(1, 6):
+                phen.point.pdata += 100
+                phen.field.fdata += 10
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+
+        df = campo.dataframe.select(dataset.phen, property_names=["pdata"])
+        values = df["phen"]["point"]["pdata"]["values"]
+
+        self.assertEqual([2, 4], list(values.coords["timestep"].values))
+        self.assertTrue(np.array_equal(np.repeat([[200, 400]], 3, axis=0), values.values))
+
+        self.assertEqual([400, 400, 400], list(campo.to_df(df, 4)["pdata"]))
+        with self.assertRaises(ValueError):
+            campo.to_df(df, 3)
+
+        df = campo.dataframe.select(dataset.phen, property_names=["fdata"])
+        values = df["phen"]["field"]["fdata"][0]
+
+        self.assertEqual([5], list(values.coords["timestep"].values))
+        self.assertTrue(np.array_equal(np.full((1, 2, 3), 50), values.values))
@@ -1,6 +1,8 @@
 import datetime
+import os
 import unittest
 
+import h5py
 import numpy as np
 
 import campo
@@ -66,6 +68,8 @@ class TestDynamicModel(unittest.TestCase):
 
             self.ds.write(timestep)
 
+        self.ds.close()
+
         # ldm.assert_is_valid(filename)
 
     def test_2(self):
@@ -100,6 +104,8 @@ class TestDynamicModel(unittest.TestCase):
             phen2.field.fdata += 100
             ds.write(timestep)
 
+        ds.close()
+
         dataset = ldm.open_dataset(filename, "r")
         pset_points = dataset.phenomena["phen1"].property_sets["point"]
         pset_fields = dataset.phenomena["phen2"].property_sets["field"]
@@ -109,7 +115,8 @@ class TestDynamicModel(unittest.TestCase):
         self.assertTrue(nr_pagents == 4)
         self.assertTrue(nr_fagents == 4)
 
-        pvalues = pset_points.pdata.value[:]
+        # Time-major, one row per timestep
+        pvalues = pset_points.pdata.value[:].reshape(self.timesteps, nr_pagents).T
         fvalues = pset_fields.fdata.value[0][:]
 
         pvalid = np.repeat([700, 900, 1100, 1300, 1500], nr_pagents).reshape(self.timesteps, nr_pagents).T
@@ -119,3 +126,521 @@ class TestDynamicModel(unittest.TestCase):
 
         self.assertTrue(np.array_equal(fvalues, fvalid))
         self.assertTrue(np.array_equal(pvalues, pvalid))
+
+    def test_3(self):
+        """ Writing and reading a dynamic network """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+
+        phen.point.pdata = 1.0
+        phen.point.neighbours = campo.Relation.from_edges(4, [0, 1, 2], [1, 2, 3], [0.5, 1.0, 2.0])
+
+        filename = "TestDynamicModel_test_3.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                if timestep == 3:
+                    phen.point.neighbours.add_edges([3], [0])
+                    phen.point.neighbours.remove_edges([0], [1])
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+
+        initial = campo.dataframe.select_relation(dataset, "phen", "point", "neighbours", timestep=2)
+        self.assertEqual([0, 1, 2, 3, 3], list(initial.indptr))
+        self.assertEqual([1, 2, 3], list(initial.indices))
+        self.assertEqual([0.5, 1.0, 2.0], list(initial.weights))
+
+        final = campo.dataframe.select_relation(dataset, "phen", "point", "neighbours")
+        self.assertEqual([0, 0, 1, 2, 3], list(final.indptr))
+        self.assertEqual([2, 3, 0], list(final.indices))
+
+        # Only the initial and changed edge lists are stored
+        edges = dataset.phenomena["phen_point_neighbours"].property_sets["edges"]
+        self.assertEqual(2, len(edges.time_domain.value[:]))
+
+    def test_4(self):
+        """ Buffered output of several timesteps """
+
+        ds = campo.Campo(seed=13)
+
+        phen1 = ds.add_phenomenon("phen1")
+        phen2 = ds.add_phenomenon("phen2")
+
+        phen1.add_property_set("point", "locations.csv")
+        phen2.add_property_set("field", "extent.csv")
+
+        phen1.point.pdata = 500
+        phen2.field.fdata = 300
+
+        filename = "TestDynamicModel_test_4.lue"
+        ds.create_dataset(filename)
+        ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+        ds.set_output_buffer(steps=2)
+
+        phen1.point.pdata.is_dynamic = True
+        phen2.field.fdata.is_dynamic = True
+
+        ds.write()
+
+        for timestep in range(1, self.timesteps + 1):
+            phen1.point.pdata += 200
+            phen2.field.fdata += 100
+            ds.write(timestep)
+
+        # The last timestep is written on close
+        ds.close()
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_points = dataset.phenomena["phen1"].property_sets["point"]
+        pset_fields = dataset.phenomena["phen2"].property_sets["field"]
+
+        nr_pagents = 4
+        pvalues = pset_points.pdata.value[:].reshape(self.timesteps, nr_pagents).T
+        fvalues = pset_fields.fdata.value[0][:]
+
+        pvalid = np.repeat([700, 900, 1100, 1300, 1500], nr_pagents).reshape(self.timesteps, nr_pagents).T
+        fvalid = np.repeat([400, 500, 600, 700, 800], 2 * 3).reshape(self.timesteps, 2, 3)
+
+        self.assertTrue(np.array_equal(fvalues, fvalid))
+        self.assertTrue(np.array_equal(pvalues, pvalid))
+
+    def test_5(self):
+        """ Asynchronous output """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+        phen.add_property_set("field", "extent.csv")
+
+        phen.point.pdata = 500
+        phen.field.fdata = 300
+
+        filename = "TestDynamicModel_test_5.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+            ds.set_output_buffer(steps=2, asynchronous=True, queue_size=1)
+
+            phen.point.pdata.is_dynamic = True
+            phen.field.fdata.is_dynamic = True
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                phen.point.pdata += 200
+                phen.field.fdata += 100
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_points = dataset.phenomena["phen"].property_sets["point"]
+        pset_fields = dataset.phenomena["phen"].property_sets["field"]
+
+        nr_pagents = 4
+        pvalues = pset_points.pdata.value[:].reshape(self.timesteps, nr_pagents).T
+        fvalues = pset_fields.fdata.value[0][:]
+
+        pvalid = np.repeat([700, 900, 1100, 1300, 1500], nr_pagents).reshape(self.timesteps, nr_pagents).T
+        fvalid = np.repeat([400, 500, 600, 700, 800], 2 * 3).reshape(self.timesteps, 2, 3)
+
+        self.assertTrue(np.array_equal(fvalues, fvalid))
+        self.assertTrue(np.array_equal(pvalues, pvalid))
+
+    def test_6(self):
+        """ Compressed output """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+        phen.add_property_set("field", "extent.csv")
+
+        phen.point.pdata = 500
+        phen.field.fdata = 300
+        phen.field.fdata.storage = campo.StorageOptions(compression="gzip", level=6, shuffle=True)
+
+        filename = "TestDynamicModel_test_6.lue"
+
+        with ds:
+            ds.create_dataset(filename, storage=campo.StorageOptions(compression="gzip"))
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            phen.point.pdata.is_dynamic = True
+            phen.field.fdata.is_dynamic = True
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                phen.point.pdata += 200
+                phen.field.fdata += 100
+                ds.write(timestep)
+
+        ds.repack()
+
+        ldm.assert_is_valid(filename)
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_points = dataset.phenomena["phen"].property_sets["point"]
+        pset_fields = dataset.phenomena["phen"].property_sets["field"]
+
+        nr_pagents = 4
+        pvalues = pset_points.pdata.value[:].reshape(self.timesteps, nr_pagents).T
+        fvalues = pset_fields.fdata.value[0][:]
+
+        pvalid = np.repeat([700, 900, 1100, 1300, 1500], nr_pagents).reshape(self.timesteps, nr_pagents).T
+        fvalid = np.repeat([400, 500, 600, 700, 800], 2 * 3).reshape(self.timesteps, 2, 3)
+
+        self.assertTrue(np.array_equal(fvalues, fvalid))
+        self.assertTrue(np.array_equal(pvalues, pvalid))
+
+        # Layout of the HDF5 datasets holding the values
+        datasets = {}
+
+        def add(name, item):
+            if isinstance(item, h5py.Dataset) and item.size > 0:
+                datasets[name] = (item.compression, item.compression_opts, item.shuffle, item.chunks)
+
+        with h5py.File(filename, "r") as content:
+            content.visititems(add)
+
+        fdatasets = [layout for name, layout in datasets.items() if "fdata" in name.split("/") and layout[3] is not None and len(layout[3]) == 3]
+        pdatasets = [layout for name, layout in datasets.items() if "pdata" in name.split("/")]
+
+        self.assertTrue(len(fdatasets) > 0)
+        for layout in fdatasets:
+            # Property options replace the dataset options, one timestep per chunk
+            self.assertEqual(("gzip", 6, True, (1, 2, 3)), layout)
+
+        self.assertTrue(len(pdatasets) > 0)
+        for compression, level, shuffle, chunks in pdatasets:
+            self.assertEqual(("gzip", 4, False), (compression, level, shuffle))
+
+    def test_7(self):
+        """ Output schedules """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+        phen.add_property_set("field", "extent.csv")
+
+        phen.point.pdata = 500
+        phen.field.fdata = 300
+
+        filename = "TestDynamicModel_test_7.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            phen.point.pdata.is_dynamic = True
+            phen.point.pdata.set_output(every=2)
+            phen.field.fdata.is_dynamic = True
+            phen.field.fdata.set_output(final=True)
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                phen.point.pdata += 200
+                phen.field.fdata += 100
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_points = dataset.phenomena["phen"].property_sets["point"]
+        pset_fields = dataset.phenomena["phen"].property_sets["field"]
+
+        self.assertTrue(np.array_equal([[1, 2], [3, 4]], pset_points.time_domain.value[:]))
+        self.assertTrue(np.array_equal([[4, 5]], pset_fields.time_domain.value[:]))
+
+        nr_pagents = 4
+        pvalues = pset_points.pdata.value[:].reshape(2, nr_pagents).T
+        fvalues = pset_fields.fdata.value[0][:]
+
+        self.assertTrue(np.array_equal(pvalues, np.repeat([900, 1300], nr_pagents).reshape(2, nr_pagents).T))
+        self.assertTrue(np.array_equal(fvalues, np.full((1, 2, 3), 800)))
+
+    def test_8(self):
+        """ Writing accumulators """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("field", "extent.csv")
+
+        phen.field.fdata = 300
+        phen.field.fsum = campo.Accumulator(phen.field.fdata, "sum", window=2)
+
+        filename = "TestDynamicModel_test_8.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                phen.field.fdata += 100
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_fields = dataset.phenomena["phen"].property_sets["field"]
+
+        self.assertTrue(np.array_equal([[1, 2], [3, 4], [4, 5]], pset_fields.time_domain.value[:]))
+
+        fvalues = pset_fields.fsum.value[0][:]
+        fvalid = np.repeat([900, 1300, 800], 2 * 3).reshape(3, 2, 3)
+
+        self.assertTrue(np.array_equal(fvalues, fvalid))
+
+    def test_9(self):
+        """ Resuming a run from a checkpoint """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+        phen.add_property_set("field", "extent.csv")
+
+        phen.point.pdata = 500
+        phen.field.fdata = 300
+
+        filename = "TestDynamicModel_test_9.lue"
+        checkpoint = "TestDynamicModel_test_9.npz"
+
+        ds.create_dataset(filename)
+        ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+        phen.point.pdata.is_dynamic = True
+        phen.field.fdata.is_dynamic = True
+
+        ds.write()
+
+        for timestep in range(1, 3):
+            phen.point.pdata += 200
+            phen.field.fdata += 100
+            ds.write(timestep)
+
+        ds.checkpoint(checkpoint)
+        ds.close()
+
+        expected = campo.config.rng.random(3)
+
+        ds = campo.Campo.restore(checkpoint)
+        self.assertEqual(2, ds.timestep)
+        self.assertTrue(np.array_equal(expected, campo.config.rng.random(3)))
+
+        phen = ds.phenomena["phen"]
+
+        with ds:
+            for timestep in range(ds.timestep + 1, self.timesteps + 1):
+                phen.point.pdata += 200
+                phen.field.fdata += 100
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_points = dataset.phenomena["phen"].property_sets["point"]
+        pset_fields = dataset.phenomena["phen"].property_sets["field"]
+
+        nr_pagents = 4
+        pvalues = pset_points.pdata.value[:].reshape(self.timesteps, nr_pagents).T
+        fvalues = pset_fields.fdata.value[0][:]
+
+        pvalid = np.repeat([700, 900, 1100, 1300, 1500], nr_pagents).reshape(self.timesteps, nr_pagents).T
+        fvalid = np.repeat([400, 500, 600, 700, 800], 2 * 3).reshape(self.timesteps, 2, 3)
+
+        self.assertTrue(np.array_equal(fvalues, fvalid))
+        self.assertTrue(np.array_equal(pvalues, pvalid))
+
+    def test_10(self):
+        """ Storage options without the HDF5 tools """
+
+        ds = campo.Campo(seed=13)
+
+        path = os.environ["PATH"]
+        os.environ["PATH"] = ""
+
+        try:
+            with self.assertRaises(RuntimeError):
+                ds.create_dataset("TestDynamicModel_test_10.lue", storage=campo.StorageOptions(compression="gzip"))
+            with self.assertRaises(RuntimeError):
+                ds.set_storage(campo.StorageOptions(compression="gzip"))
+        finally:
+            os.environ["PATH"] = path
+
+    def test_11(self):
+        """ Values modified in place between writes """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+
+        phen.point.pdata = 0.0
+
+        filename = "TestDynamicModel_test_11.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+            ds.set_output_buffer(steps=self.timesteps)
+
+            phen.point.pdata.is_dynamic = True
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                phen.point.pdata.values().values[1][0] = timestep
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+        pset_points = dataset.phenomena["phen"].property_sets["point"]
+
+        nr_pagents = 4
+        pvalues = pset_points.pdata.value[:].reshape(self.timesteps, nr_pagents).T
+
+        self.assertTrue(np.array_equal(pvalues[1], [1, 2, 3, 4, 5]))
+        self.assertTrue(np.array_equal(pvalues[0], np.zeros(self.timesteps)))
+
+    def test_12(self):
+        """ Replacing a relation between timesteps """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+
+        phen.point.pdata = 1.0
+        phen.point.neighbours = campo.Relation.from_edges(4, [0], [1])
+
+        filename = "TestDynamicModel_test_12.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                # New instances with equal versions
+                phen.point.neighbours = campo.Relation.from_edges(4, [timestep % 4], [(timestep + 1) % 4])
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+
+        for timestep in range(1, self.timesteps + 1):
+            relation = campo.dataframe.select_relation(dataset, "phen", "point", "neighbours", timestep=timestep)
+            self.assertEqual(1, relation.nr_edges)
+            self.assertEqual([(timestep + 1) % 4], list(relation.neighbours(timestep % 4)))
+
+    def test_13(self):
+        """ Changing the output schedule after writing """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("field", "extent.csv")
+
+        phen.field.fdata = 300
+
+        filename = "TestDynamicModel_test_13.lue"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            phen.field.fdata.is_dynamic = True
+
+            ds.write()
+            ds.write(1)
+
+            phen.field.fdata.set_output(every=2)
+
+            with self.assertRaises(ValueError):
+                ds.write(2)
+
+    def test_14(self):
+        """ Relations of a run resumed from a checkpoint """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+
+        phen.point.pdata = 1.0
+        phen.point.neighbours = campo.Relation.from_edges(4, [0], [1])
+
+        filename = "TestDynamicModel_test_14.lue"
+        checkpoint = "TestDynamicModel_test_14.npz"
+
+        with ds:
+            ds.create_dataset(filename)
+            ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+
+            ds.write()
+
+            for timestep in range(1, self.timesteps + 1):
+                phen.point.neighbours = campo.Relation.from_edges(4, [0], [timestep % 4])
+                ds.write(timestep)
+
+                if timestep == 2:
+                    ds.checkpoint(checkpoint)
+
+        # The resumed run keeps the edges of the checkpoint
+        ds = campo.Campo.restore(checkpoint)
+
+        with ds:
+            for timestep in range(ds.timestep + 1, self.timesteps + 1):
+                ds.write(timestep)
+
+        dataset = ldm.open_dataset(filename, "r")
+
+        for timestep, target in zip(range(1, self.timesteps + 1), [1, 2, 2, 2, 2]):
+            relation = campo.dataframe.select_relation(dataset, "phen", "point", "neighbours", timestep=timestep)
+            self.assertEqual([target], list(relation.neighbours(0)))
+
+    def test_15(self):
+        """ Errors of the background writer do not mask errors of the model """
+
+        ds = campo.Campo(seed=13)
+
+        phen = ds.add_phenomenon("phen")
+        phen.add_property_set("point", "locations.csv")
+        phen.point.pdata = 500
+
+        filename = "TestDynamicModel_test_15.lue"
+
+        def failing_write(buffer):
+            raise IOError("writing failed")
+
+        with self.assertRaises(KeyError):
+            with ds:
+                ds.create_dataset(filename)
+                ds.set_time(self.start, self.unit, self.stepsize, self.timesteps)
+                ds.set_output_buffer(steps=1, asynchronous=True)
+
+                phen.point.pdata.is_dynamic = True
+                ds.write()
+
+                ds._write_output = failing_write
+                phen.point.pdata += 200
+                ds.write(1)
+
+                raise KeyError("model error")
+
+        self.assertIsNone(ds._writer_thread)
+
+        # Without an error of the model the writer error is raised
+        with self.assertRaises(IOError):
+            with ds:
+                phen.point.pdata += 200
+                ds.write(2)
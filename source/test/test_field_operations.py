@@ -0,0 +1,197 @@
+import unittest
+
+import numpy as np
+
+import campo
+
+
+class TestFieldOperations(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(self):
+        pass
+
+    @classmethod
+    def setUpClass(self):
+
+        with open("fieldops_extents.csv", "w") as content:
+            content.write("0,0,30,20,2,3\n")
+            content.write("20,10,40,50,4,2\n")
+            content.write("100,100,110,110,1,1\n")
+
+        with open("fieldops_locations.csv", "w") as content:
+            content.write("5,15\n25,15\n39,12\n60,60\n")
+
+        with open("fieldops_visitors.csv", "w") as content:
+            content.write("5,15\n6,16\n25,15\n39,12\n")
+
+        with open("fieldops_centroids.csv", "w") as content:
+            content.write("15,10\n30,30\n105,105\n")
+
+        with open("fieldops_borders.csv", "w") as content:
+            content.write("30,5\n25,10\n100,110\n")
+
+        with open("fieldops_tiles.csv", "w") as content:
+            for idx in range(4):
+                content.write(f"{10 * idx},0,{10 * idx + 9},6,2,3\n")
+
+        with open("fieldops_tile_centroids.csv", "w") as content:
+            for idx in range(4):
+                content.write(f"{10 * idx + 5},3\n")
+
+        self.ds = campo.Campo(seed=13)
+
+        self.a = self.ds.add_phenomenon("a")
+        self.a.add_property_set("fields", "fieldops_extents.csv")
+        self.a.add_property_set("centroids", "fieldops_centroids.csv")
+
+        self.b = self.ds.add_phenomenon("b")
+        self.b.add_property_set("households", "fieldops_locations.csv")
+
+        self.f = self.ds.add_phenomenon("f")
+        self.f.add_property_set("borders", "fieldops_borders.csv")
+
+        self.e = self.ds.add_phenomenon("e")
+        self.e.add_property_set("tiles", "fieldops_tiles.csv")
+        self.e.add_property_set("tile_centroids", "fieldops_tile_centroids.csv")
+
+        self.c = self.ds.add_phenomenon("c")
+        self.c.add_property_set("visitors", "fieldops_visitors.csv")
+        self.c.visitors.nr_visits = np.array([1.0, 2.0, 3.0, 4.0])
+
+        self.a.fields.pollution = 0.0
+        for idx in range(self.a.nr_agents):
+            shape = self.a.fields.pollution.values()[idx].shape
+            self.a.fields.pollution.values()[idx] = np.arange(shape[0] * shape[1], dtype=np.float64).reshape(shape) + 10 * idx
+
+    def test_01(self):
+        """ Sampling field values at point locations """
+
+        sampled = campo.sample(self.a.fields.pollution, self.b.households)
+
+        expected = [0.0, 2.0, 17.0, np.nan]
+        for idx, value in enumerate(sampled.values()):
+            if np.isnan(expected[idx]):
+                self.assertTrue(np.isnan(value[0]))
+            else:
+                self.assertEqual(expected[idx], value[0])
+
+    def test_02(self):
+        """ Zonal statistics of field agents of different shapes """
+
+        mean = campo.zonal(self.a.centroids, self.a.fields.pollution, 'mean')
+        maximum = campo.zonal(self.a.centroids, self.a.fields.pollution, 'max')
+        count = campo.zonal(self.a.centroids, self.a.fields.pollution, 'count')
+        median = campo.zonal(self.a.centroids, self.a.fields.pollution, 'percentile', percentile=50)
+
+        self.assertEqual([2.5, 13.5, 20.0], [value[0] for value in mean.values()])
+        self.assertEqual([5.0, 17.0, 20.0], [value[0] for value in maximum.values()])
+        self.assertEqual([6.0, 8.0, 1.0], [value[0] for value in count.values()])
+        self.assertEqual([2.5, 13.5, 20.0], [value[0] for value in median.values()])
+
+    def test_03(self):
+        """ Zonal statistics with a mask """
+
+        self.a.fields.mask = 1.0
+        for idx in range(self.a.nr_agents):
+            self.a.fields.mask.values()[idx][0, 0] = 0.0
+
+        total = campo.zonal(self.a.centroids, self.a.fields.pollution, 'sum', mask=self.a.fields.mask)
+        minimum = campo.zonal(self.a.centroids, self.a.fields.pollution, 'min', mask=self.a.fields.mask)
+
+        self.assertEqual([15.0, 98.0, 0.0], [value[0] for value in total.values()])
+        self.assertEqual(1.0, minimum.values()[0][0])
+        self.assertEqual(11.0, minimum.values()[1][0])
+        self.assertTrue(np.isnan(minimum.values()[2][0]))
+
+    def test_04(self):
+        """ Rasterising point locations in field agents """
+
+        raster = campo.feature_to_raster_all(self.a.fields, self.b.households)
+
+        self.assertTrue(np.array_equal([[1, 0, 1], [0, 0, 0]], raster.values()[0]))
+        self.assertTrue(np.array_equal([[0, 0], [0, 0], [0, 0], [1, 1]], raster.values()[1]))
+        self.assertTrue(np.array_equal([[0]], raster.values()[2]))
+
+        raster = campo.feature_to_raster(self.a.fields, self.b.households)
+
+        self.assertTrue(np.array_equal([[1, 0, 0], [0, 0, 0]], raster.values()[0]))
+        self.assertTrue(np.array_equal([[0, 0], [0, 0], [0, 0], [1, 0]], raster.values()[1]))
+        self.assertTrue(np.array_equal([[0]], raster.values()[2]))
+
+    def test_05(self):
+        """ Aggregating point values in field agent cells """
+
+        count = campo.points_to_raster(self.a.fields, self.c.visitors)
+        self.assertTrue(np.array_equal([[2, 0, 1], [0, 0, 0]], count.values()[0]))
+        self.assertTrue(np.array_equal([[0, 0], [0, 0], [0, 0], [1, 1]], count.values()[1]))
+
+        total = campo.points_to_raster(self.a.fields, self.c.visitors, self.c.visitors.nr_visits, 'sum')
+        self.assertTrue(np.array_equal([[3, 0, 3], [0, 0, 0]], total.values()[0]))
+
+        mean = campo.points_to_raster(self.a.fields, self.c.visitors, self.c.visitors.nr_visits, 'mean')
+        self.assertEqual(1.5, mean.values()[0][0, 0])
+        self.assertTrue(np.isnan(mean.values()[0][1, 1]))
+
+        last = campo.points_to_raster(self.a.fields, self.c.visitors, self.c.visitors.nr_visits, 'last')
+        self.assertEqual(2.0, last.values()[0][0, 0])
+        self.assertEqual(4.0, last.values()[1][3, 1])
+        self.assertTrue(np.isnan(last.values()[2][0, 0]))
+
+    def test_06(self):
+        """ Zonal statistics of field agents of the same shape """
+
+        rng = np.random.default_rng(7)
+
+        self.e.tiles.height = 0.0
+        arrays = []
+        for idx in range(self.e.nr_agents):
+            array = rng.random((2, 3))
+            array[idx % 2, idx % 3] = np.nan
+            arrays.append(array)
+
+        # Agent without valid cells
+        arrays[3][:] = np.nan
+
+        for idx, array in enumerate(arrays):
+            self.e.tiles.height.values()[idx] = array
+
+        reference = {
+            'sum': np.sum,
+            'mean': np.mean,
+            'min': np.min,
+            'max': np.max,
+            'count': np.size,
+            'std': np.std,
+            'percentile': lambda cells: np.percentile(cells, 30),
+        }
+
+        for statistic, function in reference.items():
+            result = campo.zonal(self.e.tile_centroids, self.e.tiles.height, statistic, percentile=30)
+
+            for idx, array in enumerate(arrays):
+                cells = array[~np.isnan(array)]
+                if cells.size > 0:
+                    expected = function(cells)
+                elif statistic in ('sum', 'count'):
+                    expected = 0.0
+                else:
+                    expected = np.nan
+
+                self.assertTrue(np.isclose(expected, result.values()[idx][0], equal_nan=True), statistic)
+
+    def test_07(self):
+        """ Rasterising point locations on the borders of field agents """
+
+        # Points on the eastern and southern borders are outside, as with GDAL
+        raster = campo.feature_to_raster(self.a.fields, self.f.borders)
+
+        self.assertTrue(np.array_equal(np.zeros((2, 3)), raster.values()[0]))
+        self.assertTrue(np.array_equal(np.zeros((4, 2)), raster.values()[1]))
+        self.assertTrue(np.array_equal([[1]], raster.values()[2]))
+
+        raster = campo.feature_to_raster_all(self.a.fields, self.f.borders)
+
+        self.assertTrue(np.array_equal([[0, 0, 0], [0, 0, 1]], raster.values()[0]))
+        self.assertTrue(np.array_equal(np.zeros((4, 2)), raster.values()[1]))
+        self.assertTrue(np.array_equal([[1]], raster.values()[2]))
@@ -107,6 +107,8 @@ class TestMobileAgents(unittest.TestCase):
           self.assertTrue(((y_coords + timestep) == curr_mp.ycoord).all())
 
 
+      self.ds.close()
+
       # ldm.assert_is_valid("TestMobileAgents_test_1.lue")
 
       dataset = ldm.open_dataset("TestMobileAgents_test_1.lue", "r")
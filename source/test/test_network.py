@@ -0,0 +1,215 @@
+import unittest
+
+import numpy as np
+
+import campo
+
+
+class TestNetwork(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(self):
+        pass
+
+    @classmethod
+    def setUpClass(self):
+
+        with open("network_locations.csv", "w") as content:
+            content.write("0,0\n1,0\n2,0\n3,0\n4,0\n")
+
+        self.ds = campo.Campo(seed=13)
+
+        self.a = self.ds.add_phenomenon("a")
+        self.a.add_property_set("b", "network_locations.csv")
+
+        # 0 - 1 - 2 - 3, agent 4 is isolated
+        self.dense = np.zeros((5, 5), dtype=np.int8)
+        for source, target in [(0, 1), (1, 2), (2, 3)]:
+            self.dense[source, target] = 1
+            self.dense[target, source] = 1
+
+        self.a.b.neighbours = campo.Relation.from_dense(self.dense)
+
+        self.a.b.opinion = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+
+        with open("network_daisies.csv", "w") as content:
+            content.write("0,0\n1,0\n2,0\n3,0\n4,0\n5,0\n")
+
+        with open("network_extent.csv", "w") as content:
+            content.write("0,0,6,1,1,6\n")
+
+        self.d = self.ds.add_phenomenon("d")
+        self.d.add_property_set("daisies", "network_daisies.csv")
+
+        self.g = self.ds.add_phenomenon("g")
+        self.g.add_property_set("grid", "network_extent.csv")
+
+    def test_01(self):
+        """ Relation attached to a property set """
+
+        relation = self.a.b.neighbours
+
+        self.assertEqual("neighbours", relation.name)
+        self.assertEqual(self.a.b.uuid, relation.pset_uuid)
+        self.assertEqual(6, relation.nr_edges)
+        self.assertEqual([1, 2, 2, 1, 0], list(relation.degree()))
+        self.assertEqual([0, 2], list(relation.neighbours(1)))
+        self.assertTrue(np.array_equal(self.dense, relation.to_dense(np.int8)))
+
+    def test_02(self):
+        """ Relation from edge lists """
+
+        relation = campo.Relation.from_edges(3, [2, 0, 0], [0, 2, 1], [0.5, 1.0, 2.0])
+
+        self.assertEqual([0, 2, 2, 3], list(relation.indptr))
+        self.assertEqual([1, 2, 0], list(relation.indices))
+        self.assertEqual([2.0, 1.0, 0.5], list(relation.weights))
+
+    def test_03(self):
+        """ Small-world network stored as relation """
+
+        relation = campo.neighbour_network(100, 4, 0.1, seed=3)
+
+        self.assertEqual(100, relation.nr_objects)
+        self.assertEqual(400, relation.nr_edges)
+        dense = relation.to_dense()
+        self.assertTrue(np.array_equal(dense, dense.T))
+
+    def test_04(self):
+        """ Network average over neighbours """
+
+        default = campo.Property('default', self.a.b.uuid, self.a.b.space_domain, self.a.b.shapes, -1.0)
+        result = campo.network_average_def(self.a.b.neighbours, self.a.b.opinion, default)
+
+        expected = [2.0, 2.0, 3.0, 3.0, -1.0]
+        for idx, value in enumerate(result.values()):
+            self.assertAlmostEqual(expected[idx], float(np.squeeze(value)))
+
+    def test_05(self):
+        """ Network average equals dense neighbour average """
+
+        relation = campo.neighbour_network(200, 6, 0.2, seed=11)
+        values = np.random.default_rng(2).uniform(0, 1, 200)
+
+        dense = relation.to_dense()
+        expected = dense @ values / dense.sum(axis=1)
+
+        self.assertTrue(np.allclose(expected, relation.dot(values) / relation.degree()))
+
+    def test_06(self):
+        """ Spreading to free neighbours, lowest agent index wins conflicts """
+
+        daisies = self.d.daisies
+        daisies.neighbours = campo.Relation.from_edges(6, [0, 1, 1, 2, 3, 4, 4, 5], [1, 0, 2, 1, 4, 3, 5, 4])
+
+        daisies.mask = np.array([1.0, -1.0, 1.0, 1.0, -1.0, 0.0])
+        daisies.breed = np.array([1.0, 0.0, 2.0, 1.0, 0.0, 2.0])
+        daisies.albedo = np.array([0.75, 0.0, 0.25, 0.75, 0.0, 0.25])
+        daisies.age = np.array([3.0, 0.0, 2.0, 4.0, 0.0, 1.0])
+        daisies.random_seed = 0.0
+
+        self.g.grid.threshold = 0.5
+
+        campo.spread_neighbours(daisies.neighbours, self.g.grid.threshold, daisies.random_seed,
+                                daisies.breed, daisies.mask, daisies.albedo, daisies.age, seed=5)
+
+        self.assertEqual([1.0, 1.0, 1.0, 1.0, 1.0, 0.0], [value[0] for value in daisies.mask.values()])
+        self.assertEqual([1.0, 1.0, 2.0, 1.0, 1.0, 2.0], [value[0] for value in daisies.breed.values()])
+        self.assertEqual(0.75, daisies.albedo.values()[1][0])
+        self.assertEqual(1.0, daisies.age.values()[4][0])
+
+    def test_07(self):
+        """ Native small-world and random network generators """
+
+        lattice = campo.small_world_network(10, 4, 0.0)
+        self.assertEqual([1, 2, 8, 9], list(lattice.neighbours(0)))
+
+        for relation in [campo.small_world_network(500, 6, 0.3, seed=1), campo.random_network(300, 0.05, seed=1)]:
+            sources = relation.sources()
+            self.assertFalse(np.any(sources == relation.indices))
+            keys = sources * relation.nr_objects + relation.indices
+            self.assertEqual(keys.size, np.unique(keys).size)
+            dense = relation.to_dense()
+            self.assertTrue(np.array_equal(dense, dense.T))
+
+        self.assertEqual(3000, campo.small_world_network(500, 6, 0.3, seed=1).nr_edges)
+
+        first = campo.random_network(300, 0.05, seed=7)
+        second = campo.random_network(300, 0.05, seed=7)
+        self.assertTrue(np.array_equal(first.indices, second.indices))
+
+    def test_08(self):
+        """ Spatial k nearest neighbour network """
+
+        relation = campo.knn_network(self.a.b, 2)
+
+        self.assertEqual([1, 2], list(relation.neighbours(0)))
+        self.assertEqual([2, 3], list(relation.neighbours(4)))
+        self.assertEqual(10, relation.nr_edges)
+
+    def test_09(self):
+        """ Proximity networks by radius and nearest agents """
+
+        relation = campo.proximity_network(self.a.b, radius=1.0)
+
+        self.assertEqual([0, 1, 3, 5, 7, 8], list(relation.indptr))
+        self.assertEqual([3], list(relation.neighbours(4)))
+
+        relation = campo.proximity_network(self.a.b, k=1)
+        self.assertEqual(5, relation.nr_edges)
+
+        result = campo.network_average(campo.proximity_network(self.a.b, radius=1.5), self.a.b.opinion, None)
+        expected = [2.0, 2.0, 3.0, 4.0, 4.0]
+        for idx, value in enumerate(result.values()):
+            self.assertAlmostEqual(expected[idx], value[0])
+
+        with self.assertRaises(ValueError):
+            campo.proximity_network(self.a.b, radius=1.0, k=2)
+
+    def test_10(self):
+        """ Multi-hop diffusion, propagation and normalised sums """
+
+        diffused = campo.network_diffusion(self.a.b.neighbours, self.a.b.opinion, steps=2, rate=0.5)
+        expected = [1.75, 2.125, 2.875, 3.25, 5.0]
+        for idx, value in enumerate(diffused.values()):
+            self.assertAlmostEqual(expected[idx], value[0])
+
+        propagated = campo.network_pagerank(self.a.b.neighbours, self.a.b.opinion, damping=0.5, tolerance=1e-12)
+        values = np.array([value[0] for value in propagated.values()])
+        dense = self.dense.astype(np.float64)
+        degree = np.maximum(dense.sum(axis=1), 1.0)
+        initial = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+        neighbour_mean = np.where(dense.sum(axis=1) > 0, dense @ values / degree, values)
+        self.assertTrue(np.allclose(values, 0.5 * initial + 0.5 * neighbour_mean))
+
+        sums = campo.network_sum(self.a.b.neighbours, self.a.b.opinion)
+        self.assertEqual([2.0, 4.0, 6.0, 3.0, 0.0], [value[0] for value in sums.values()])
+
+        sums = campo.network_sum(self.a.b.neighbours, self.a.b.opinion, normalisation='target')
+        self.assertEqual([1.0, 2.5, 5.0, 1.5, 0.0], [value[0] for value in sums.values()])
+
+        # Directed, neighbour values are divided by their number of incoming edges
+        directed = campo.Relation.from_edges(5, [0, 0, 1, 3], [1, 2, 2, 2])
+        sums = campo.network_sum(directed, self.a.b.opinion, normalisation='target')
+        self.assertEqual([3.0, 1.0, 0.0, 1.0, 0.0], [value[0] for value in sums.values()])
+
+    def test_11(self):
+        """ Incremental edge updates """
+
+        relation = campo.Relation.from_edges(4, [0, 1, 2], [1, 2, 3])
+        version = relation.version
+
+        relation.add_edges([3, 0], [0, 2], symmetric=True)
+        relation.remove_edges([1], [2])
+        relation.add_edges([1], [2], weights=0.5)
+        relation.remove_edges([0], [1])
+
+        self.assertEqual(version + 4, relation.version)
+        self.assertEqual([2, 3], list(relation.neighbours(0)))
+        self.assertEqual([2], list(relation.neighbours(1)))
+        self.assertEqual(0.5, relation.weights[relation.indptr[1]])
+        self.assertEqual([0, 3], list(relation.neighbours(2)))
+        self.assertEqual([2, 1, 2, 1], list(relation.degree()))
+
+        with self.assertRaises(ValueError):
+            relation.add_edges([4], [0])
@@ -213,3 +213,58 @@ class TestProperty(unittest.TestCase):
 
         self.assertEqual(str(context_manager.exception),
             "Array of shape (2, 3) cannot be assigned to one agent, use shape (1, 2, 3)")
+
+    def test_16(self):
+        """ Output schedules """
+        self.a.b.e = 1.0
+
+        self.assertEqual(list(range(1, 11)), list(self.a.b.e.output_timesteps(10)))
+
+        self.a.b.e.set_output(every=4)
+        self.assertEqual([4, 8], list(self.a.b.e.output_timesteps(10)))
+
+        self.a.b.e.set_output(every=4, timesteps=[1, 3, 3], final=True)
+        self.assertEqual([1, 3, 4, 8, 10], list(self.a.b.e.output_timesteps(10)))
+
+        self.a.b.e.set_output(timesteps=[11])
+        with self.assertRaises(ValueError):
+            self.a.b.e.output_timesteps(10)
+
+    def test_17(self):
+        """ Accumulators over windows of timesteps """
+        self.a.b.temp = np.array([1.0, 2.0, 3.0, 4.0])
+        self.a.b.temp_mean = campo.Accumulator(self.a.b.temp, "mean", window=2)
+        self.a.b.temp_max = campo.Accumulator(self.a.b.temp, "max", window=2)
+
+        self.assertEqual([2, 4, 5], list(self.a.b.temp_mean.output_timesteps(5)))
+
+        for timestep in range(1, 6):
+            self.a.b.temp = np.array([1.0, 2.0, 3.0, 4.0]) * timestep
+            for name, accumulator in self.a.b.accumulators.items():
+                accumulator.update(self.a.b.properties[name], timestep, 5)
+
+            if timestep == 4:
+                self.assertEqual([3.5, 7.0, 10.5, 14.0], [value[0] for value in self.a.b.temp_mean.values()])
+                self.assertEqual([4.0, 8.0, 12.0, 16.0], [value[0] for value in self.a.b.temp_max.values()])
+
+        # Incomplete final window
+        self.assertEqual([5.0, 10.0, 15.0, 20.0], [value[0] for value in self.a.b.temp_mean.values()])
+
+    def test_18(self):
+        """ Accumulators ignore repeated timesteps, and need the output schedule of the property set """
+        self.a.add_property_set("acc", "locations.csv")
+
+        self.a.acc.temp = np.array([1.0, 2.0, 3.0, 4.0])
+        self.a.acc.temp_sum = campo.Accumulator(self.a.acc.temp, "sum")
+
+        accumulator = self.a.acc.accumulators["temp_sum"]
+        for timestep in [1, 1, 2]:
+            accumulator.update(self.a.acc.temp_sum, timestep, 2)
+
+        self.assertEqual([2.0, 4.0, 6.0, 8.0], [value[0] for value in self.a.acc.temp_sum.values()])
+
+        self.a.acc.level = 1.0
+        self.a.acc.level.is_dynamic = True
+
+        with self.assertRaises(ValueError):
+            self.a.acc.level_max = campo.Accumulator(self.a.acc.temp, "max", window=2)
@@ -0,0 +1,125 @@
+import unittest
+
+import numpy as np
+
+import campo
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(self):
+        pass
+
+    @classmethod
+    def setUpClass(self):
+
+        rng = np.random.default_rng(5)
+        self.nr_points = 500
+        self.xcoord = rng.uniform(0, 1000, self.nr_points)
+        self.ycoord = rng.uniform(0, 500, self.nr_points)
+
+        with open("index_locations.csv", "w") as content:
+            for x, y in zip(self.xcoord, self.ycoord):
+                content.write(f"{x},{y}\n")
+
+        self.ds = campo.Campo(seed=13)
+
+        self.a = self.ds.add_phenomenon("a")
+        self.a.add_property_set("b", "index_locations.csv")
+
+        with open("index_facilities.csv", "w") as content:
+            content.write("0,0\n1000,500\n500,250")
+
+        self.f = self.ds.add_phenomenon("f")
+        self.f.add_property_set("facilities", "index_facilities.csv")
+
+        with open("index_extents.csv", "w") as content:
+            content.write("0,0,30,20,2,3\n")
+            content.write("20,10,40,50,4,2\n")
+            content.write("100,100,110,110,1,1\n")
+
+        self.f.add_property_set("extents", "index_extents.csv")
+
+    def brute_force_distances(self, domain, xcoord, ycoord):
+        return np.hypot(domain.xcoord[np.newaxis, :] - xcoord[:, np.newaxis],
+                        domain.ycoord[np.newaxis, :] - ycoord[:, np.newaxis])
+
+    def test_01(self):
+        """ k nearest neighbours of stationary points """
+
+        domain = self.a.b.space_domain
+        index = domain.spatial_index()
+
+        qx = np.array([-50.0, 10.0, 500.0, 999.0])
+        qy = np.array([20.0, 490.0, 250.0, 600.0])
+
+        indices, distances = index.query_knn(qx, qy, 5)
+
+        expected = np.sort(self.brute_force_distances(domain, qx, qy), axis=1)[:, :5]
+        self.assertTrue(np.allclose(distances, expected))
+
+    def test_02(self):
+        """ Radius queries follow moving points """
+
+        domain = self.a.b.space_domain
+        index = domain.spatial_index()
+
+        rng = np.random.default_rng(7)
+
+        for timestep in range(1, 6):
+            domain.xcoord = domain.xcoord + rng.normal(0, 5, self.nr_points)
+            domain.ycoord = domain.ycoord + rng.normal(0, 5, self.nr_points)
+
+            index = domain.spatial_index()
+            indptr, indices, distances = index.query_radius(domain.xcoord, domain.ycoord, 40.0, exclude_self=True)
+
+            expected = self.brute_force_distances(domain, domain.xcoord, domain.ycoord) <= 40.0
+            np.fill_diagonal(expected, False)
+
+            for idx in range(self.nr_points):
+                found = np.sort(indices[indptr[idx]:indptr[idx + 1]])
+                self.assertTrue(np.array_equal(found, np.flatnonzero(expected[idx])))
+
+        self.assertIs(index, domain.spatial_index())
+
+    def test_03(self):
+        """ Nearest facility and nearest other agent """
+
+        domain = self.a.b.space_domain
+        facilities = self.f.facilities.space_domain
+
+        indices, distances = campo.nearest(self.a.b, self.f.facilities, 2)
+
+        expected = self.brute_force_distances(facilities, domain.xcoord, domain.ycoord)
+        order = np.argsort(expected, axis=1)[:, :2]
+
+        for idx in range(self.nr_points):
+            self.assertTrue(np.array_equal(indices.values()[idx], order[idx]))
+            self.assertTrue(np.allclose(distances.values()[idx], expected[idx, order[idx]]))
+
+        indices, distances = campo.nearest(self.a.b, self.a.b)
+
+        expected = self.brute_force_distances(domain, domain.xcoord, domain.ycoord)
+        np.fill_diagonal(expected, np.inf)
+
+        for idx in range(self.nr_points):
+            self.assertAlmostEqual(distances.values()[idx][0], expected[idx].min())
+
+    def test_04(self):
+        """ Locating points in field agents """
+
+        domain = self.f.extents.space_domain
+        index = domain.extent_index()
+
+        xcoord = np.array([5.0, 25.0, 39.0, 30.0, 60.0])
+        ycoord = np.array([15.0, 15.0, 12.0, 0.0, 60.0])
+
+        points, agents, rows, cols = index.query(xcoord, ycoord)
+
+        self.assertTrue(np.array_equal(points, [0, 1, 1, 2, 3]))
+        self.assertTrue(np.array_equal(agents, [0, 0, 1, 1, 0]))
+        self.assertTrue(np.array_equal(rows, [0, 0, 3, 3, 1]))
+        self.assertTrue(np.array_equal(cols, [0, 2, 0, 1, 2]))
+
+        self.assertIs(index, domain.extent_index())
@@ -11,6 +11,9 @@ import test_property
 import test_mobile_agents
 import test_dataframe
 import test_dynamic_model
+import test_spatial_index
+import test_field_operations
+import test_network
 
 
 if __name__ == "__main__":
@@ -20,6 +23,9 @@ if __name__ == "__main__":
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_phenomenon))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_propertyset))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_property))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_spatial_index))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_field_operations))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_network))
 
     suite.addTest(unittest.TestLoader().loadTestsFromModule(extract_const_diff))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(extract_const_same))